@@ -1,28 +1,95 @@
 from __future__ import annotations
 
+import argparse
+import asyncio
 import logging
+import os
+import socket
 
-from app.anki_client import AnkiMcpClient
-from app.config import load_config
-from app.generator import CopilotGenerator
+from telegram.ext import Application
+
+from app.anki_client import AnkiClientError, AnkiMcpClient, AnkiSchemaError
+from app.config import Config, load_config
+from app.generator import CompletionGenerator, CopilotGenerator
+from app.jobs import JobStore
+from app.recording import RecordingGenerator
 from app.service import FlashcardService
 from app.state import StateStore
-from app.telegram_adapter import build_application
+from app.telegram_adapter import build_application, build_frontend_application
+from app.worker import Worker
+
+logger = logging.getLogger(__name__)
 
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app")
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        choices=("bot", "frontend", "worker"),
+        default="bot",
+        help="bot: single process (default); frontend: receive updates and queue jobs; "
+        "worker: process queued jobs",
+    )
+    args = parser.parse_args(argv)
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s %(levelname)s %(name)s %(message)s",
         datefmt="%Y-%m-%dT%H:%M:%S%z",
     )
     config = load_config()
-    generator = CopilotGenerator()
-    anki_client = AnkiMcpClient(base_url=config.anki_mcp_url)
-    service = FlashcardService(config, generator, anki_client, StateStore())
-    app = build_application(config, service)
+    if args.mode == "frontend":
+        build_frontend_application(config, _job_store(config)).run_polling()
+        return
+
+    anki_client = AnkiMcpClient(
+        base_url=config.anki_mcp_url,
+        deck_name=config.anki_deck,
+        note_type=config.note_type,
+        reverse_note_type=config.reverse_note_type,
+    )
+    generator: CompletionGenerator = CopilotGenerator(candidates=config.generator_candidates)
+    if config.recordings_path is not None:
+        generator = RecordingGenerator(generator, config.recordings_path)
+    state_store = StateStore(path=config.state_path, history_limit=config.history_limit)
+    service = FlashcardService(config, generator, anki_client, state_store)
+
+    if args.mode == "worker":
+        asyncio.run(_run_worker(config, service, anki_client))
+        return
+
+    async def validate_anki_schema(_: Application) -> None:
+        await _validate_anki_schema(anki_client)
+
+    app = build_application(config, service, post_init=validate_anki_schema)
     app.run_polling()
 
 
+async def _run_worker(
+    config: Config, service: FlashcardService, anki_client: AnkiMcpClient
+) -> None:
+    await _validate_anki_schema(anki_client)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    worker = Worker(config, service, _job_store(config), worker_id)
+    await worker.run(concurrency=config.worker_concurrency)
+
+
+async def _validate_anki_schema(anki_client: AnkiMcpClient) -> None:
+    try:
+        await anki_client.validate_schema()
+    except AnkiSchemaError:
+        raise
+    except AnkiClientError as exc:
+        logger.warning("Skipping Anki schema validation: %s", exc)
+
+
+def _job_store(config: Config) -> JobStore:
+    return JobStore(
+        config.job_store_path,
+        lease_seconds=config.job_lease_seconds,
+        max_attempts=config.job_max_attempts,
+    )
+
+
 if __name__ == "__main__":
     main()
@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import json
 import logging
+from dataclasses import dataclass
 from typing import Protocol
 
 import httpx
 
-from app.models import Flashcard
+from app.deadline import Deadline, record_miss, stage_timeout
+from app.models import BASIC_NOTE_TYPE, REVERSED_NOTE_TYPE, Flashcard, NoteType
 
 logger = logging.getLogger(__name__)
 
@@ -15,14 +17,39 @@ class AnkiClientError(Exception):
     pass
 
 
+class AnkiSchemaError(AnkiClientError):
+    pass
+
+
+@dataclass(frozen=True)
+class AnkiSchema:
+    decks: frozenset[str]
+    models: frozenset[str]
+    model_fields: dict[str, tuple[str, ...]]
+
+
 class AnkiClient(Protocol):
-    async def add_note(self, flashcard: Flashcard) -> int:  # pragma: no cover - interface
+    async def add_note(
+        self, flashcard: Flashcard, *, deadline: Deadline | None = None
+    ) -> int:  # pragma: no cover - interface
         raise NotImplementedError
 
-    async def delete_note(self, note_id: int) -> None:  # pragma: no cover - interface
+    async def delete_notes(
+        self, note_ids: list[int], *, deadline: Deadline | None = None
+    ) -> None:  # pragma: no cover - interface
         raise NotImplementedError
 
-    async def sync(self) -> None:  # pragma: no cover - interface
+    async def update_note(
+        self,
+        note_id: int,
+        flashcard: Flashcard,
+        *,
+        change_model: bool = False,
+        deadline: Deadline | None = None,
+    ) -> None:  # pragma: no cover - interface
+        raise NotImplementedError
+
+    async def sync(self, *, deadline: Deadline | None = None) -> None:  # pragma: no cover
         raise NotImplementedError
 
 
@@ -32,46 +59,116 @@ class AnkiMcpClient:
         base_url: str,
         deck_name: str = "Default",
         transport: httpx.AsyncBaseTransport | None = None,
+        *,
+        note_type: NoteType = BASIC_NOTE_TYPE,
+        reverse_note_type: NoteType = REVERSED_NOTE_TYPE,
     ) -> None:
         self._base_url = base_url.rstrip("/")
         self._deck_name = deck_name
         self._transport = transport
+        self._note_type = note_type
+        self._reverse_note_type = reverse_note_type
+        self._schema: AnkiSchema | None = None
 
-    async def add_note(self, flashcard: Flashcard) -> int:
-        model_name = "Basic (and reversed card)" if flashcard.create_reverse else "Basic"
+    async def add_note(self, flashcard: Flashcard, *, deadline: Deadline | None = None) -> int:
+        note_type = self._note_type_for(flashcard)
         payload = {
             "deck_name": self._deck_name,
-            "model_name": model_name,
-            "fields": {"Front": flashcard.front, "Back": flashcard.back},
+            "model_name": note_type.model_name,
+            "fields": note_type.render(flashcard),
             "allow_duplicate": True,
         }
-        result = await self._call_tool("add_note", payload)
+        result = await self._call_tool("add_note", payload, deadline)
         note_id = result.get("note_id")
         if note_id is None:
             raise AnkiClientError("Anki returned empty note id")
         return int(note_id)
 
-    async def delete_note(self, note_id: int) -> None:
-        await self._call_tool("delete_notes", {"notes": [note_id], "confirmDeletion": True})
+    async def delete_note(self, note_id: int, *, deadline: Deadline | None = None) -> None:
+        await self.delete_notes([note_id], deadline=deadline)
 
-    async def sync(self) -> None:
-        await self._call_tool("sync", {})
+    async def delete_notes(self, note_ids: list[int], *, deadline: Deadline | None = None) -> None:
+        await self._call_tool(
+            "delete_notes", {"notes": list(note_ids), "confirmDeletion": True}, deadline
+        )
 
-    async def _call_tool(self, name: str, arguments: dict) -> dict:
+    async def update_note(
+        self,
+        note_id: int,
+        flashcard: Flashcard,
+        *,
+        change_model: bool = False,
+        deadline: Deadline | None = None,
+    ) -> None:
+        note_type = self._note_type_for(flashcard)
+        note = {"id": note_id, "fields": note_type.render(flashcard)}
+        if change_model:
+            note["modelName"] = note_type.model_name
+            await self._call_tool("update_note_model", {"note": note}, deadline)
+        else:
+            await self._call_tool("update_note_fields", {"note": note}, deadline)
+
+    async def sync(self, *, deadline: Deadline | None = None) -> None:
+        await self._call_tool("sync", {}, deadline)
+
+    async def get_schema(self) -> AnkiSchema:
+        if self._schema is None:
+            decks = _names(await self._call_tool("list_decks", {}))
+            models = _names(await self._call_tool("model_names", {}))
+            model_fields = {}
+            for note_type in (self._note_type, self._reverse_note_type):
+                name = note_type.model_name
+                if name in models and name not in model_fields:
+                    result = await self._call_tool("model_field_names", {"modelName": name})
+                    model_fields[name] = tuple(_names(result))
+            self._schema = AnkiSchema(
+                decks=frozenset(decks), models=frozenset(models), model_fields=model_fields
+            )
+        return self._schema
+
+    def invalidate_schema(self) -> None:
+        self._schema = None
+
+    async def validate_schema(self) -> None:
+        schema = await self.get_schema()
+        problems = []
+        if self._deck_name not in schema.decks:
+            problems.append(f"deck {self._deck_name!r} does not exist")
+        for note_type in (self._note_type, self._reverse_note_type):
+            if note_type.model_name not in schema.models:
+                problems.append(f"note type {note_type.model_name!r} does not exist")
+                continue
+            known = schema.model_fields.get(note_type.model_name, ())
+            missing = [name for name in note_type.field_names if name not in known]
+            if missing:
+                problems.append(
+                    f"note type {note_type.model_name!r} has no fields {', '.join(missing)}"
+                )
+        if problems:
+            raise AnkiSchemaError("Invalid Anki configuration: " + "; ".join(problems))
+        logger.info("Anki schema validated (deck=%s)", self._deck_name)
+
+    def _note_type_for(self, flashcard: Flashcard) -> NoteType:
+        return self._reverse_note_type if flashcard.create_reverse else self._note_type
+
+    async def _call_tool(
+        self, name: str, arguments: dict, deadline: Deadline | None = None
+    ) -> dict:
         logger.info("Anki MCP call started (tool=%s)", name)
-        session_id = await self._initialize_session()
+        stage = f"anki.{name}"
+        session_id = await self._initialize_session(deadline, stage)
         payload = {
             "jsonrpc": "2.0",
             "id": 2,
             "method": "tools/call",
             "params": {"name": name, "arguments": arguments},
         }
-        response_text = await self._post_sse(payload, session_id)
+        response_text = await self._post_sse(payload, session_id, deadline=deadline, stage=stage)
         result = _extract_result(response_text)
         logger.info("Anki MCP call completed (tool=%s)", name)
         return result
 
-    async def _initialize_session(self) -> str:
+    async def _initialize_session(self, deadline: Deadline | None, stage: str) -> str:
         logger.info("Anki MCP initialize started")
         payload = {
             "jsonrpc": "2.0",
@@ -83,7 +180,9 @@ class AnkiMcpClient:
                 "clientInfo": {"name": "anki-telegram", "version": "0.1"},
             },
         }
-        response_text, session_id = await self._post_sse(payload, None, return_session=True)
+        response_text, session_id = await self._post_sse(
+            payload, None, return_session=True, deadline=deadline, stage=stage
+        )
         _extract_result(response_text)
         if not session_id:
             raise AnkiClientError("Missing MCP session id")
@@ -91,15 +190,22 @@ class AnkiMcpClient:
         return session_id
 
     async def _post_sse(
-        self, payload: dict, session_id: str | None, *, return_session: bool = False
+        self,
+        payload: dict,
+        session_id: str | None,
+        *,
+        return_session: bool = False,
+        deadline: Deadline | None = None,
+        stage: str = "anki",
     ) -> tuple[str, str | None] | str:
         headers = {"Accept": "application/json, text/event-stream"}
         if session_id:
             headers["mcp-session-id"] = session_id
+        timeout = stage_timeout(deadline, stage, 10.0)
         try:
             async with httpx.AsyncClient(
                 base_url=self._base_url,
-                timeout=10.0,
+                timeout=timeout,
                 transport=self._transport,
                 headers=headers,
             ) as client:
@@ -108,11 +214,26 @@ class AnkiMcpClient:
                 text = response.text
                 sid = response.headers.get("mcp-session-id")
         except httpx.HTTPError as exc:
+            if (
+                isinstance(exc, httpx.TimeoutException)
+                and deadline is not None
+                and deadline.expired
+            ):
+                record_miss(stage)
             logger.error("Anki MCP request failed: %s", exc)
             raise AnkiClientError("Failed to reach Anki MCP server") from exc
         return (text, sid) if return_session else text
 
 
+def _names(result: dict) -> list[str]:
+    for value in result.values():
+        if isinstance(value, list):
+            return [
+                str(item.get("name", "")) if isinstance(item, dict) else str(item) for item in value
+            ]
+    raise AnkiClientError("Unexpected MCP list response")
+
+
 def _extract_result(response_text: str) -> dict:
     for line in response_text.splitlines():
         if line.startswith("data: "):
@@ -5,16 +5,43 @@ from pathlib import Path
 
 import yaml
 
+from app.models import BASIC_NOTE_TYPE, REVERSED_NOTE_TYPE, NoteType
+
 
 @dataclass(frozen=True)
 class Config:
     telegram_token: str
     allowed_user_id: int
     anki_mcp_url: str
+    anki_deck: str = "Default"
+    dedup_window_seconds: float = 5.0
+    state_path: Path | None = None
+    generator_candidates: int = 1
+    note_type: NoteType = BASIC_NOTE_TYPE
+    reverse_note_type: NoteType = REVERSED_NOTE_TYPE
+    request_deadline_seconds: float = 30.0
+    min_sync_budget_seconds: float = 5.0
+    history_limit: int = 200
+    job_store_path: Path = Path("jobs.sqlite3")
+    job_lease_seconds: float = 30.0
+    job_max_attempts: int = 3
+    worker_concurrency: int = 4
+    recordings_path: Path | None = None
 
 
 DEFAULT_CONFIG_PATH = Path("config.yaml")
 DEFAULT_ANKI_MCP_URL = "http://127.0.0.1:3141/"
+DEFAULT_ANKI_DECK = "Default"
+DEFAULT_DEDUP_WINDOW_SECONDS = 5.0
+DEFAULT_STATE_PATH = Path("state.sqlite3")
+DEFAULT_GENERATOR_CANDIDATES = 1
+DEFAULT_REQUEST_DEADLINE_SECONDS = 30.0
+DEFAULT_MIN_SYNC_BUDGET_SECONDS = 5.0
+DEFAULT_HISTORY_LIMIT = 200
+DEFAULT_JOB_STORE_PATH = Path("jobs.sqlite3")
+DEFAULT_JOB_LEASE_SECONDS = 30.0
+DEFAULT_JOB_MAX_ATTEMPTS = 3
+DEFAULT_WORKER_CONCURRENCY = 4
 
 
 def load_config(path: Path | None = None) -> Config:
@@ -30,4 +57,83 @@ def load_config(path: Path | None = None) -> Config:
         user_id = int(user_id_raw)
     except (TypeError, ValueError) as exc:
         raise ValueError("TG_USER_ID must be an integer") from exc
-    return Config(telegram_token=token, allowed_user_id=user_id, anki_mcp_url=DEFAULT_ANKI_MCP_URL)
+    deck = str(data.get("ANKI_DECK", DEFAULT_ANKI_DECK)).strip()
+    if not deck:
+        raise ValueError("ANKI_DECK must not be empty")
+    dedup_window = _load_seconds(data, "DEDUP_WINDOW_SECONDS", DEFAULT_DEDUP_WINDOW_SECONDS)
+    candidates = _load_positive_int(data, "GENERATOR_CANDIDATES", DEFAULT_GENERATOR_CANDIDATES)
+    request_deadline = _load_seconds(
+        data, "REQUEST_DEADLINE_SECONDS", DEFAULT_REQUEST_DEADLINE_SECONDS
+    )
+    if request_deadline <= 0:
+        raise ValueError("REQUEST_DEADLINE_SECONDS must be positive")
+    min_sync_budget = _load_seconds(
+        data, "MIN_SYNC_BUDGET_SECONDS", DEFAULT_MIN_SYNC_BUDGET_SECONDS
+    )
+    history_limit = _load_positive_int(data, "HISTORY_LIMIT", DEFAULT_HISTORY_LIMIT)
+    job_lease = _load_seconds(data, "JOB_LEASE_SECONDS", DEFAULT_JOB_LEASE_SECONDS)
+    if job_lease <= 0:
+        raise ValueError("JOB_LEASE_SECONDS must be positive")
+    state_path = Path(str(data.get("STATE_PATH", DEFAULT_STATE_PATH)))
+    recordings_path = data.get("RECORDINGS_PATH")
+    return Config(
+        telegram_token=token,
+        allowed_user_id=user_id,
+        anki_mcp_url=DEFAULT_ANKI_MCP_URL,
+        anki_deck=deck,
+        dedup_window_seconds=dedup_window,
+        state_path=state_path,
+        generator_candidates=candidates,
+        note_type=_load_note_type(data, "ANKI_NOTE_TYPE", BASIC_NOTE_TYPE),
+        reverse_note_type=_load_note_type(data, "ANKI_REVERSE_NOTE_TYPE", REVERSED_NOTE_TYPE),
+        request_deadline_seconds=request_deadline,
+        min_sync_budget_seconds=min_sync_budget,
+        history_limit=history_limit,
+        job_store_path=Path(str(data.get("JOB_STORE_PATH", DEFAULT_JOB_STORE_PATH))),
+        job_lease_seconds=job_lease,
+        job_max_attempts=_load_positive_int(data, "JOB_MAX_ATTEMPTS", DEFAULT_JOB_MAX_ATTEMPTS),
+        worker_concurrency=_load_positive_int(
+            data, "WORKER_CONCURRENCY", DEFAULT_WORKER_CONCURRENCY
+        ),
+        recordings_path=Path(str(recordings_path)) if recordings_path else None,
+    )
+
+
+def _load_positive_int(data: dict, key: str, default: int) -> int:
+    try:
+        value = int(data.get(key, default))
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"{key} must be an integer") from exc
+    if value < 1:
+        raise ValueError(f"{key} must be at least 1")
+    return value
+
+
+def _load_seconds(data: dict, key: str, default: float) -> float:
+    try:
+        value = float(data.get(key, default))
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"{key} must be a number") from exc
+    if value < 0:
+        raise ValueError(f"{key} must not be negative")
+    return value
+
+
+def _load_note_type(data: dict, key: str, default: NoteType) -> NoteType:
+    raw = data.get(key)
+    if raw is None:
+        return default
+    if not isinstance(raw, dict):
+        raise ValueError(f"{key} must be a mapping with model and fields")
+    model_name = str(raw.get("model", "")).strip()
+    fields = raw.get("fields")
+    if not model_name:
+        raise ValueError(f"{key}.model is required")
+    if not isinstance(fields, dict) or not fields:
+        raise ValueError(f"{key}.fields must be a non-empty mapping")
+    return NoteType(
+        model_name=model_name,
+        fields=tuple(
+            (str(name), "" if value is None else str(value)) for name, value in fields.items()
+        ),
+    )
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_MISSES: Counter[str] = Counter()
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@dataclass(frozen=True)
+class Deadline:
+    expires_at: float
+
+    @classmethod
+    def after(cls, seconds: float) -> Deadline:
+        return cls(expires_at=time.monotonic() + seconds)
+
+    @classmethod
+    def until(cls, timestamp: float) -> Deadline:
+        return cls.after(timestamp - time.time())
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+def stage_timeout(deadline: Deadline | None, stage: str, limit: float) -> float:
+    if deadline is None:
+        return limit
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        record_miss(stage)
+        raise DeadlineExceeded(f"No time left for {stage}")
+    return min(limit, remaining)
+
+
+def record_miss(stage: str) -> None:
+    DEADLINE_MISSES[stage] += 1
+    logger.warning("Deadline missed (stage=%s, total=%d)", stage, DEADLINE_MISSES[stage])
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from app.generator import (
+    DEFAULT_MODEL,
+    PROMPT_HEAD,
+    CompletionGenerator,
+    CopilotGenerator,
+    GeneratorError,
+    build_prompt,
+    parse_flashcard_candidates,
+    prompt_hash,
+    split_reverse_directive,
+)
+from app.models import Flashcard
+from app.recording import RecordingGenerator, ReplayGenerator
+
+DEFAULT_GOLDEN_PATH = Path("evals/golden.jsonl")
+CASES = ("A", "B", "C", "D")
+CHARS_PER_TOKEN = 4
+MIN_STEM_LENGTH = 4
+MAX_ENDING_LENGTH = 3
+
+_PAIR_SEPARATOR = re.compile(r"\s+[-–—=]\s+|\s*:\s+")
+_CYRILLIC = re.compile(r"[а-яё]", re.IGNORECASE)
+_NOT_WORD = re.compile(r"[^\w]+")
+
+
+@dataclass(frozen=True)
+class GoldenCase:
+    input: str
+    case: str
+    create_reverse: bool | None = None
+
+
+@dataclass(frozen=True)
+class CaseResult:
+    golden: GoldenCase
+    latency: float
+    raw_output: str | None = None
+    flashcard: Flashcard | None = None
+    predicted_case: str | None = None
+    error: str | None = None
+
+
+@dataclass(frozen=True)
+class Report:
+    model: str
+    prompt_hash: str
+    total: int
+    generated: int
+    parsed: int
+    parse_success_rate: float
+    case_agreement: float
+    reverse_agreement: float | None
+    mean_prompt_tokens: float
+    mean_output_tokens: float
+    latency_p50: float
+    latency_p90: float
+    latency_p99: float
+    mismatches: tuple[str, ...] = ()
+
+
+def load_golden(path: Path) -> list[GoldenCase]:
+    cases = []
+    with path.open(encoding="utf-8") as handle:
+        for number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            case = str(data.get("case", "")).upper()
+            if case not in CASES:
+                raise ValueError(f"{path}:{number}: case must be one of {', '.join(CASES)}")
+            reverse = data.get("create_reverse")
+            cases.append(
+                GoldenCase(
+                    input=str(data["input"]),
+                    case=case,
+                    create_reverse=None if reverse is None else bool(reverse),
+                )
+            )
+    return cases
+
+
+def classify_case(text: str, flashcard: Flashcard) -> str | None:
+    content, _ = split_reverse_directive(text)
+    front = _normalize(flashcard.front)
+    parts = _PAIR_SEPARATOR.split(content, maxsplit=1)
+    if len(parts) == 2 and front == _normalize(parts[0]):
+        return "A"
+    if front == _normalize(content):
+        if len(content.split()) > 2 and not _CYRILLIC.search(content):
+            return "B"
+        return "D"
+    front_words = front.split()
+    if all(
+        any(_same_stem(word, token) for token in front_words)
+        for word in _normalize(content).split()
+    ):
+        return "C"
+    return None
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+async def evaluate(
+    generator: CompletionGenerator,
+    cases: Sequence[GoldenCase],
+    *,
+    candidates: int = 1,
+    prompt_head: str = PROMPT_HEAD,
+    concurrency: int = 4,
+) -> Report:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(golden: GoldenCase) -> CaseResult:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                raw = await generator.complete(golden.input)
+            except (GeneratorError, TimeoutError) as exc:
+                return CaseResult(golden, time.perf_counter() - started, error=str(exc))
+            latency = time.perf_counter() - started
+        try:
+            flashcard = parse_flashcard_candidates(raw)[0]
+        except GeneratorError as exc:
+            return CaseResult(golden, latency, raw_output=raw, error=str(exc))
+        return CaseResult(
+            golden,
+            latency,
+            raw_output=raw,
+            flashcard=flashcard,
+            predicted_case=classify_case(golden.input, flashcard),
+        )
+
+    results = await asyncio.gather(*(run(golden) for golden in cases))
+    prompt_tokens = [
+        _approx_tokens(build_prompt(golden.input, candidates, prompt_head)) for golden in cases
+    ]
+    return build_report(generator.model, generator.prompt_hash, results, prompt_tokens)
+
+
+def build_report(
+    model: str, prompt_hash: str, results: Sequence[CaseResult], prompt_tokens: Sequence[int]
+) -> Report:
+    total = len(results)
+    generated = [result for result in results if result.raw_output is not None]
+    parsed = [result for result in generated if result.flashcard is not None]
+    agreeing = [result for result in parsed if result.predicted_case == result.golden.case]
+    with_reverse = [result for result in parsed if result.golden.create_reverse is not None]
+    reverse_agreeing = [
+        result
+        for result in with_reverse
+        if result.flashcard is not None
+        and result.flashcard.create_reverse == result.golden.create_reverse
+    ]
+    latencies = [result.latency for result in generated]
+    output_tokens = [_approx_tokens(result.raw_output or "") for result in generated]
+    return Report(
+        model=model,
+        prompt_hash=prompt_hash,
+        total=total,
+        generated=len(generated),
+        parsed=len(parsed),
+        parse_success_rate=_ratio(len(parsed), total),
+        case_agreement=_ratio(len(agreeing), len(parsed)),
+        reverse_agreement=_ratio(len(reverse_agreeing), len(with_reverse))
+        if with_reverse
+        else None,
+        mean_prompt_tokens=_mean(prompt_tokens),
+        mean_output_tokens=_mean(output_tokens),
+        latency_p50=percentile(latencies, 50),
+        latency_p90=percentile(latencies, 90),
+        latency_p99=percentile(latencies, 99),
+        mismatches=tuple(
+            f"{result.golden.input!r}: expected {result.golden.case}, "
+            f"got {result.predicted_case or '?'}"
+            if result.error is None
+            else f"{result.golden.input!r}: {result.error}"
+            for result in results
+            if result.error is not None or result.predicted_case != result.golden.case
+        ),
+    )
+
+
+def format_report(report: Report) -> str:
+    reverse = "n/a" if report.reverse_agreement is None else f"{report.reverse_agreement:.1%}"
+    lines = [
+        f"Model: {report.model} (prompt {report.prompt_hash})",
+        f"Inputs: {report.total}, generated: {report.generated}, parsed: {report.parsed}",
+        f"Parse success: {report.parse_success_rate:.1%}",
+        f"CASE agreement: {report.case_agreement:.1%}",
+        f"Reverse agreement: {reverse}",
+        f"Tokens (approx, mean): prompt {report.mean_prompt_tokens:.0f}, "
+        f"output {report.mean_output_tokens:.0f}",
+        f"Latency: p50 {report.latency_p50:.2f}s, p90 {report.latency_p90:.2f}s, "
+        f"p99 {report.latency_p99:.2f}s",
+    ]
+    if report.mismatches:
+        lines.append("Mismatches:")
+        lines.extend(f"  {mismatch}" for mismatch in report.mismatches)
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.evaluate")
+    parser.add_argument("--golden", type=Path, default=DEFAULT_GOLDEN_PATH)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--prompt-file", type=Path, help="replace PROMPT_HEAD with this file")
+    parser.add_argument("--candidates", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--replay", type=Path, help="serve outputs from a recordings file")
+    source.add_argument("--record", type=Path, help="append live outputs to a recordings file")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+    if args.candidates < 1 or args.concurrency < 1:
+        parser.error("--candidates and --concurrency must be at least 1")
+
+    prompt_head = args.prompt_file.read_text().strip() if args.prompt_file else PROMPT_HEAD
+    generator: CompletionGenerator
+    if args.replay is not None:
+        generator = ReplayGenerator.from_file(
+            args.replay,
+            model=args.model,
+            prompt_hash=prompt_hash(prompt_head, args.candidates),
+            simulate_latency=True,
+        )
+    else:
+        generator = CopilotGenerator(
+            candidates=args.candidates, model=args.model, prompt_head=prompt_head
+        )
+        if args.record is not None:
+            generator = RecordingGenerator(generator, args.record)
+
+    report = asyncio.run(
+        evaluate(
+            generator,
+            load_golden(args.golden),
+            candidates=args.candidates,
+            prompt_head=prompt_head,
+            concurrency=args.concurrency,
+        )
+    )
+    if args.json:
+        print(json.dumps(asdict(report), ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+
+
+def _normalize(text: str) -> str:
+    return _NOT_WORD.sub(" ", text.casefold()).strip()
+
+
+def _same_stem(word: str, token: str) -> bool:
+    prefix = len(os.path.commonprefix([word, token]))
+    return prefix == len(word) or prefix >= max(MIN_STEM_LENGTH, len(word) - MAX_ENDING_LENGTH)
+
+
+def _approx_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _mean(values: Sequence[int]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def _ratio(part: int, whole: int) -> float:
+    return part / whole if whole else 0.0
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
 import logging
 from dataclasses import dataclass
@@ -14,12 +15,17 @@ except ModuleNotFoundError:  # pragma: no cover - optional dependency
     SessionEventType = None
     PermissionHandler = None
 
+from app.deadline import Deadline, record_miss, stage_timeout
 from app.models import Flashcard
 
 # ruff: noqa: E501
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = "gpt-4.1"
+COPILOT_TIMEOUT_SECONDS = 20.0
+COPILOT_CLOSE_TIMEOUT_SECONDS = 5.0
+
 PROMPT_HEAD = """
 You are FlashcardJSON, a flashcard generator.
 
@@ -105,6 +111,19 @@ NOW DO THE TASK
 """.strip()
 
 
+CANDIDATES_INSTRUCTIONS = """
+====================
+ALTERNATIVES
+====================
+Instead of a single object, output a JSON array of exactly {count} flashcard objects, each with the keys above.
+- All objects must use the same CASE and the same create_reverse value.
+- The first object is your best answer; the others must be genuinely different alternatives (for CASE C use a different context sentence in each).
+""".strip()
+
+REVERSE_DIRECTIVES = ("reverse", "реверс", "rev", "r")
+REVERSE_PHRASES = ("c обратной", "с обратной")
+
+
 class GeneratorError(Exception):
     pass
 
@@ -113,47 +132,129 @@ class GeneratorError(Exception):
 class GeneratorResult:
     flashcard: Flashcard
     raw_output: str
+    alternatives: tuple[Flashcard, ...] = ()
 
 
 class Generator:
-    async def generate(self, text: str) -> GeneratorResult:  # pragma: no cover - interface
+    async def generate(
+        self, text: str, deadline: Deadline | None = None
+    ) -> GeneratorResult:  # pragma: no cover - interface
         raise NotImplementedError
 
 
-class CopilotGenerator(Generator):
-    async def generate(self, text: str) -> GeneratorResult:
+class CompletionGenerator(Generator):
+    model: str
+    prompt_hash: str
+
+    async def complete(
+        self, text: str, deadline: Deadline | None = None
+    ) -> str:  # pragma: no cover - interface
+        raise NotImplementedError
+
+    async def generate(self, text: str, deadline: Deadline | None = None) -> GeneratorResult:
+        return result_from_raw(await self.complete(text, deadline))
+
+
+class CopilotGenerator(CompletionGenerator):
+    def __init__(
+        self, candidates: int = 1, model: str = DEFAULT_MODEL, prompt_head: str = PROMPT_HEAD
+    ) -> None:
+        if candidates < 1:
+            raise ValueError("candidates must be at least 1")
+        self._candidates = candidates
+        self._prompt_head = prompt_head
+        self.model = model
+        self.prompt_hash = prompt_hash(prompt_head, candidates)
+        self._closing: set[asyncio.Task[None]] = set()
+
+    async def complete(self, text: str, deadline: Deadline | None = None) -> str:
         if CopilotClient is None or SessionEventType is None or PermissionHandler is None:
             raise GeneratorError("Copilot SDK is not installed")
-        prompt = f"{PROMPT_HEAD}\n\nUSER_MESSAGE: {text.strip()}"
+        prompt = build_prompt(text, self._candidates, self._prompt_head)
+        timeout = stage_timeout(deadline, "generate", COPILOT_TIMEOUT_SECONDS)
         client = CopilotClient()
         session = None
-        await client.start()
         try:
-            session = await client.create_session(
-                on_permission_request=PermissionHandler.approve_all,
-                model="gpt-4.1",
-            )
-            logger.info("Copilot request sent")
-            async with asyncio.timeout(15):
-                event = await session.send_and_wait(prompt, timeout=15.0)
-            logger.info("Copilot response received")
-            if event is None or event.type != SessionEventType.ASSISTANT_MESSAGE:
-                raise GeneratorError("Copilot did not return a message")
-            raw = str(event.data.content).strip()
+            async with asyncio.timeout(timeout):
+                await client.start()
+                session = await client.create_session(
+                    on_permission_request=PermissionHandler.approve_all,
+                    model=self.model,
+                )
+                logger.info("Copilot request sent")
+                event = await session.send_and_wait(prompt, timeout=timeout)
+        except TimeoutError as exc:
+            if deadline is not None and deadline.expired:
+                record_miss("generate")
+            raise GeneratorError("Copilot request timed out") from exc
         finally:
+            self._close_in_background(client, session)
+        logger.info("Copilot response received")
+        if event is None or event.type != SessionEventType.ASSISTANT_MESSAGE:
+            raise GeneratorError("Copilot did not return a message")
+        return str(event.data.content).strip()
+
+    def _close_in_background(self, client, session) -> None:
+        task = asyncio.create_task(_close_copilot(client, session))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+
+async def _close_copilot(client, session) -> None:
+    try:
+        async with asyncio.timeout(COPILOT_CLOSE_TIMEOUT_SECONDS):
             if session is not None:
                 await session.disconnect()
             await client.stop()
-        flashcard = parse_flashcard_json(raw)
-        return GeneratorResult(flashcard=flashcard, raw_output=raw)
+    except Exception as exc:
+        logger.warning("Copilot client did not shut down cleanly: %s", exc)
+
+
+def build_prompt(text: str, candidates: int = 1, prompt_head: str = PROMPT_HEAD) -> str:
+    if candidates > 1:
+        instructions = CANDIDATES_INSTRUCTIONS.format(count=candidates)
+        return f"{prompt_head}\n\n{instructions}\n\nUSER_MESSAGE: {text.strip()}"
+    return f"{prompt_head}\n\nUSER_MESSAGE: {text.strip()}"
+
+
+def prompt_hash(prompt_head: str = PROMPT_HEAD, candidates: int = 1) -> str:
+    template = build_prompt("", candidates, prompt_head)
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+
+
+def result_from_raw(raw: str) -> GeneratorResult:
+    flashcard, *alternatives = parse_flashcard_candidates(raw)
+    return GeneratorResult(flashcard=flashcard, raw_output=raw, alternatives=tuple(alternatives))
 
 
 def parse_flashcard_json(raw: str) -> Flashcard:
+    return parse_flashcard_candidates(raw)[0]
+
+
+def parse_flashcard_candidates(raw: str) -> list[Flashcard]:
     try:
         payload = json.loads(raw)
     except json.JSONDecodeError as exc:
         logger.error("Copilot JSON parse error: %s", raw)
         raise GeneratorError("Failed to parse flashcard JSON") from exc
+    if isinstance(payload, list):
+        if not payload:
+            logger.error("Copilot JSON parse error: %s", raw)
+            raise GeneratorError("Flashcard JSON array is empty")
+        flashcards = [_parse_flashcard(payload[0], raw)]
+        for item in payload[1:]:
+            try:
+                candidate = _parse_flashcard(item, raw)
+            except GeneratorError:
+                logger.warning("Skipping invalid flashcard alternative: %s", item)
+                continue
+            if candidate not in flashcards:
+                flashcards.append(candidate)
+        return flashcards
+    return [_parse_flashcard(payload, raw)]
+
+
+def _parse_flashcard(payload: object, raw: str) -> Flashcard:
     if not isinstance(payload, dict):
         logger.error("Copilot JSON parse error: %s", raw)
         raise GeneratorError("Flashcard JSON must be an object")
@@ -164,3 +265,21 @@ def parse_flashcard_json(raw: str) -> Flashcard:
         logger.error("Copilot JSON parse error: %s", raw)
         raise GeneratorError("Flashcard JSON missing required fields")
     return Flashcard(front=front, back=back, create_reverse=create_reverse)
+
+
+def split_reverse_directive(text: str) -> tuple[str, bool]:
+    content = f" {' '.join(text.split())} "
+    found = False
+    for phrase in REVERSE_PHRASES:
+        index = content.casefold().find(f" {phrase} ")
+        while index != -1:
+            found = True
+            content = content[:index] + content[index + len(phrase) + 1 :]
+            index = content.casefold().find(f" {phrase} ")
+    words = []
+    for word in content.split():
+        if word.casefold() in REVERSE_DIRECTIVES:
+            found = True
+        else:
+            words.append(word)
+    return " ".join(words), found
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.models import BotResponse, dump_response, load_response
+
+logger = logging.getLogger(__name__)
+
+JOB_TEXT = "text"
+JOB_EDIT = "edit"
+JOB_ACTION = "action"
+
+STATUS_QUEUED = "queued"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+DELIVERED_RETENTION_SECONDS = 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT NOT NULL UNIQUE,
+    order_key TEXT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    response TEXT,
+    error TEXT,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires_at);
+CREATE INDEX IF NOT EXISTS jobs_undelivered ON jobs (delivered, status);
+"""
+_ORDER_INDEX = "CREATE INDEX IF NOT EXISTS jobs_order ON jobs (order_key, status, id)"
+
+
+@dataclass(frozen=True)
+class Job:
+    id: int
+    kind: str
+    payload: dict
+    attempts: int
+
+
+@dataclass(frozen=True)
+class FinishedJob:
+    id: int
+    kind: str
+    payload: dict
+    response: BotResponse | None
+
+
+class JobStore:
+    def __init__(self, path: Path, *, lease_seconds: float = 30.0, max_attempts: int = 3) -> None:
+        self._path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._db: sqlite3.Connection | None = None
+
+    def enqueue(
+        self, kind: str, payload: dict, *, dedup_key: str, order_key: str | None = None
+    ) -> bool:
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO jobs "
+                "(dedup_key, order_key, kind, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (dedup_key, order_key, kind, json.dumps(payload), STATUS_QUEUED, now, now),
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, worker_id: str) -> Job | None:
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, error = 'lease expired too many times', "
+                "lease_owner = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                (STATUS_FAILED, now, STATUS_LEASED, now, self.max_attempts),
+            )
+            row = db.execute(
+                "SELECT id, kind, payload, attempts FROM jobs j "
+                "WHERE (status = ? OR (status = ? AND lease_expires_at < ?)) "
+                "AND NOT EXISTS (SELECT 1 FROM jobs earlier WHERE earlier.order_key = j.order_key "
+                "AND earlier.status IN (?, ?) AND earlier.id < j.id) "
+                "ORDER BY id LIMIT 1",
+                (STATUS_QUEUED, STATUS_LEASED, now, STATUS_QUEUED, STATUS_LEASED),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, kind, payload, attempts = row
+            db.execute(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires_at = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (STATUS_LEASED, worker_id, now + self.lease_seconds, now, job_id),
+            )
+        if attempts:
+            logger.warning("Retrying job %s (attempt %s)", job_id, attempts + 1)
+        return Job(id=job_id, kind=kind, payload=json.loads(payload), attempts=attempts + 1)
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (now + self.lease_seconds, now, job_id, STATUS_LEASED, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str, response: BotResponse) -> bool:
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, response = ?, lease_owner = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (
+                    STATUS_DONE,
+                    dump_response(response),
+                    time.time(),
+                    job_id,
+                    STATUS_LEASED,
+                    worker_id,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> None:
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (
+                    self.max_attempts,
+                    STATUS_FAILED,
+                    STATUS_QUEUED,
+                    error,
+                    time.time(),
+                    job_id,
+                    STATUS_LEASED,
+                    worker_id,
+                ),
+            )
+
+    def finished(self, limit: int = 20) -> list[FinishedJob]:
+        rows = self._connection().execute(
+            "SELECT id, kind, payload, status, response FROM jobs "
+            "WHERE delivered = 0 AND status IN (?, ?) ORDER BY id LIMIT ?",
+            (STATUS_DONE, STATUS_FAILED, limit),
+        )
+        return [
+            FinishedJob(
+                id=job_id,
+                kind=kind,
+                payload=json.loads(payload),
+                response=load_response(response) if status == STATUS_DONE else None,
+            )
+            for job_id, kind, payload, status, response in rows
+        ]
+
+    def mark_delivered(self, job_id: int) -> None:
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET delivered = 1, updated_at = ? WHERE id = ?", (now, job_id))
+            db.execute(
+                "DELETE FROM jobs WHERE delivered = 1 AND updated_at < ?",
+                (now - DELIVERED_RETENTION_SECONDS,),
+            )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self._path), timeout=10.0, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            _migrate(self._db)
+        return self._db
+
+
+def _migrate(db: sqlite3.Connection) -> None:
+    columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+    if "order_key" not in columns:
+        db.execute("ALTER TABLE jobs ADD COLUMN order_key TEXT")
+    db.execute(_ORDER_INDEX)
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import json
+import re
+from dataclasses import asdict, dataclass
 
 
 @dataclass(frozen=True)
@@ -10,13 +12,55 @@ class Flashcard:
     create_reverse: bool
 
 
+@dataclass(frozen=True)
+class NoteType:
+    model_name: str
+    fields: tuple[tuple[str, str], ...]
+
+    @property
+    def field_names(self) -> tuple[str, ...]:
+        return tuple(name for name, _ in self.fields)
+
+    def render(self, flashcard: Flashcard) -> dict[str, str]:
+        values = {"front": flashcard.front, "back": flashcard.back}
+        return {
+            name: _PLACEHOLDER.sub(lambda match: values[match[1]], template)
+            for name, template in self.fields
+        }
+
+
+_PLACEHOLDER = re.compile(r"\{(front|back)\}")
+_BASIC_FIELDS = (("Front", "{front}"), ("Back", "{back}"))
+BASIC_NOTE_TYPE = NoteType(model_name="Basic", fields=_BASIC_FIELDS)
+REVERSED_NOTE_TYPE = NoteType(model_name="Basic (and reversed card)", fields=_BASIC_FIELDS)
+
+
 @dataclass(frozen=True)
 class AddResult:
     note_id: int
     flashcard: Flashcard
+    alternatives: tuple[Flashcard, ...] = ()
+
+
+@dataclass(frozen=True)
+class NoteRecord:
+    text: str
+    result: AddResult
 
 
 @dataclass(frozen=True)
 class BotResponse:
     message: str
     ignored: bool = False
+    note_id: int | None = None
+    actions: tuple[str, ...] = ()
+
+
+def dump_response(response: BotResponse) -> str:
+    return json.dumps(asdict(response), ensure_ascii=False)
+
+
+def load_response(raw: str) -> BotResponse:
+    data = json.loads(raw)
+    data["actions"] = tuple(data.get("actions", ()))
+    return BotResponse(**data)
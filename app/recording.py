@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from app.deadline import Deadline
+from app.generator import CompletionGenerator, GeneratorError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Recording:
+    input: str
+    prompt_hash: str
+    model: str
+    raw_output: str
+    latency: float
+    recorded_at: float = 0.0
+
+
+def load_recordings(path: Path) -> list[Recording]:
+    with path.open(encoding="utf-8") as handle:
+        return [Recording(**json.loads(line)) for line in handle if line.strip()]
+
+
+class RecordingGenerator(CompletionGenerator):
+    def __init__(self, generator: CompletionGenerator, path: Path) -> None:
+        self._generator = generator
+        self._path = path
+        self.model = generator.model
+        self.prompt_hash = generator.prompt_hash
+
+    async def complete(self, text: str, deadline: Deadline | None = None) -> str:
+        started = time.perf_counter()
+        raw = await self._generator.complete(text, deadline)
+        recording = Recording(
+            input=text.strip(),
+            prompt_hash=self.prompt_hash,
+            model=self.model,
+            raw_output=raw,
+            latency=time.perf_counter() - started,
+            recorded_at=time.time(),
+        )
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with self._path.open("a", encoding="utf-8") as handle:
+                handle.write(json.dumps(asdict(recording), ensure_ascii=False) + "\n")
+        except OSError as exc:
+            logger.warning("Failed to store generator recording: %s", exc)
+        return raw
+
+
+class ReplayGenerator(CompletionGenerator):
+    def __init__(
+        self,
+        recordings: Iterable[Recording],
+        *,
+        model: str | None = None,
+        prompt_hash: str | None = None,
+        simulate_latency: bool = False,
+    ) -> None:
+        self._recordings: dict[str, Recording] = {}
+        for recording in recordings:
+            if model is not None and recording.model != model:
+                continue
+            if prompt_hash is not None and recording.prompt_hash != prompt_hash:
+                continue
+            self._recordings[recording.input] = recording
+        self._simulate_latency = simulate_latency
+        self.model = model or "replay"
+        self.prompt_hash = prompt_hash or "replay"
+
+    @classmethod
+    def from_file(cls, path: Path, **kwargs) -> ReplayGenerator:
+        return cls(load_recordings(path), **kwargs)
+
+    def inputs(self) -> list[str]:
+        return list(self._recordings)
+
+    async def complete(self, text: str, deadline: Deadline | None = None) -> str:
+        recording = self._recordings.get(text.strip())
+        if recording is None:
+            raise GeneratorError(f"No recording for input: {text.strip()}")
+        if self._simulate_latency:
+            await asyncio.sleep(recording.latency)
+        return recording.raw_output
@@ -1,15 +1,40 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import re
+import time
+from dataclasses import replace
 
 from app.anki_client import AnkiClient
 from app.config import Config
-from app.generator import Generator
-from app.models import AddResult, BotResponse, Flashcard
+from app.deadline import Deadline
+from app.generator import Generator, split_reverse_directive
+from app.models import AddResult, BotResponse, Flashcard, NoteRecord
 from app.state import StateStore
 
 logger = logging.getLogger(__name__)
 
+ACTION_UNDO = "undo"
+ACTION_REVERSE = "reverse"
+ACTION_SWAP = "swap"
+ACTION_REGENERATE = "regen"
+ACTION_NEXT_VARIANT = "variant"
+CARD_ACTIONS = (ACTION_UNDO, ACTION_REVERSE, ACTION_SWAP, ACTION_REGENERATE)
+
+DELETE_USAGE = "Usage: /d, /d N or /d since 10m"
+DELETE_REPEATED = "Already deleted by your previous {command}. Send it again to delete more."
+STILL_WORKING = "Still working on an identical message, try again."
+_DELETE_COMMAND = re.compile(
+    r"/d(?:\s+(?P<count>\d+)|\s+since\s+(?P<amount>\d+)\s*(?P<unit>[smhd]))?", re.IGNORECASE
+)
+_DELETE_PREFIX = re.compile(r"/d(?![^\W\d_])", re.IGNORECASE)
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_DEDUP_POLL_SECONDS = 0.1
+_ADD_REQUEST = "add"
+_DELETE_REQUEST = "delete"
+
 
 class FlashcardService:
     def __init__(
@@ -23,65 +48,432 @@ class FlashcardService:
         self._generator = generator
         self._anki = anki_client
         self._state = state_store
+        self._inflight: dict[str, asyncio.Task[BotResponse]] = {}
+        self._note_locks: dict[int, asyncio.Lock] = {}
+        self._background: set[asyncio.Task[None]] = set()
 
-    async def handle_text(self, text: str, user_id: int | None = None) -> BotResponse:
+    async def handle_text(
+        self,
+        text: str,
+        user_id: int | None = None,
+        message_id: int | None = None,
+        deadline: Deadline | None = None,
+        *,
+        request_key: str | None = None,
+    ) -> BotResponse:
         if user_id is not None and user_id != self._config.allowed_user_id:
             return BotResponse(message="", ignored=True)
+        stored = self._stored_response(request_key)
+        if stored is not None:
+            return stored
 
         normalized = (text or "").strip()
         if not normalized:
             return BotResponse(message="Please send a non-empty message.")
-        if normalized == "/d":
-            return await self._handle_delete()
-        return await self._handle_add(normalized)
+        if _is_delete_command(normalized):
+            response = await self._handle_delete(normalized, user_id, deadline, request_key)
+        else:
+            response = await self._handle_add(normalized, user_id, message_id, deadline)
+        return self._finish(request_key, response)
+
+    async def handle_edit(
+        self,
+        text: str,
+        user_id: int,
+        message_id: int,
+        deadline: Deadline | None = None,
+        *,
+        request_key: str | None = None,
+    ) -> BotResponse:
+        if user_id != self._config.allowed_user_id:
+            return BotResponse(message="", ignored=True)
+        stored = self._stored_response(request_key)
+        if stored is not None:
+            return stored
+
+        normalized = (text or "").strip()
+        if not normalized or _is_delete_command(normalized):
+            return BotResponse(message="", ignored=True)
+        record = self._state.note_for_message(user_id, message_id)
+        if record is None:
+            response = await self._handle_add(normalized, user_id, message_id, deadline)
+        else:
+            response = await self._handle_update(record, normalized, deadline, request_key)
+        return self._finish(request_key, response)
+
+    async def handle_action(
+        self,
+        action: str,
+        note_id: int,
+        user_id: int,
+        deadline: Deadline | None = None,
+        *,
+        request_key: str | None = None,
+    ) -> BotResponse:
+        if user_id != self._config.allowed_user_id:
+            return BotResponse(message="", ignored=True)
+        lock = self._note_locks.setdefault(note_id, asyncio.Lock())
+        async with lock:
+            stored = self._stored_response(request_key)
+            if stored is not None:
+                return stored
+            return await self._run_action(action, note_id, deadline, request_key)
+
+    async def _run_action(
+        self, action: str, note_id: int, deadline: Deadline | None, request_key: str | None
+    ) -> BotResponse:
+        planned = self._planned(request_key)
+        if action == ACTION_UNDO and planned is not None:
+            response = await self._delete(planned, deadline, background_sync=True)
+            return self._finish(request_key, response)
+        record = self._state.get_note(note_id)
+        if record is None:
+            return BotResponse(message="This flashcard is no longer available.")
+        if action == ACTION_UNDO:
+            targets = self._plan(request_key, [record.result])
+            response = await self._delete(targets, deadline, background_sync=True)
+            return self._finish(request_key, response)
+        if planned is None:
+            update = await self._action_update(action, record, deadline)
+            if isinstance(update, BotResponse):
+                return update
+            [update] = self._plan(request_key, [update])
+        else:
+            [update] = planned
+        response = await self._apply_update(
+            record,
+            record.text,
+            update.flashcard,
+            update.alternatives,
+            deadline,
+            background_sync=True,
+        )
+        return self._finish(request_key, response)
+
+    async def _action_update(
+        self, action: str, record: NoteRecord, deadline: Deadline | None
+    ) -> AddResult | BotResponse:
+        current = record.result.flashcard
+        alternatives = record.result.alternatives
+        if action == ACTION_NEXT_VARIANT and alternatives:
+            flashcard = replace(alternatives[0], create_reverse=current.create_reverse)
+            alternatives = (*alternatives[1:], current)
+        elif action == ACTION_REVERSE:
+            flashcard = replace(current, create_reverse=not current.create_reverse)
+        elif action == ACTION_SWAP:
+            flashcard = replace(current, front=current.back, back=current.front)
+        elif action == ACTION_REGENERATE:
+            try:
+                result = await self._generator.generate(record.text, deadline=deadline)
+            except Exception as exc:
+                logger.error("Generator error: %s", exc)
+                return BotResponse(message="Sorry, I could not generate a flashcard.")
+            flashcard = result.flashcard
+            alternatives = result.alternatives
+        else:
+            logger.warning("Unsupported card action: %s", action)
+            return BotResponse(message="", ignored=True)
+        return AddResult(
+            note_id=record.result.note_id, flashcard=flashcard, alternatives=alternatives
+        )
+
+    async def _handle_add(
+        self, text: str, user_id: int | None, message_id: int | None, deadline: Deadline | None
+    ) -> BotResponse:
+        if user_id is not None and message_id is not None:
+            existing = self._state.note_for_message(user_id, message_id)
+            if existing is not None:
+                logger.info("Message already handled, returning its note")
+                return _added_response(existing.result, None)
+
+        key = self._dedup_key(_ADD_REQUEST, user_id, text)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._add_once(key, text, user_id, message_id, deadline))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info("Joining in-flight request for identical message")
+        response = await asyncio.shield(task)
+
+        if response.note_id is not None and user_id is not None and message_id is not None:
+            self._state.link_message(user_id, message_id, response.note_id)
+        return response
+
+    async def _add_once(
+        self,
+        key: str,
+        text: str,
+        user_id: int | None,
+        message_id: int | None,
+        deadline: Deadline | None,
+    ) -> BotResponse:
+        duplicate = await self._claim(key, deadline)
+        if duplicate is not None:
+            logger.info("Duplicate message absorbed by dedup window")
+            return duplicate
 
-    async def _handle_add(self, text: str) -> BotResponse:
         try:
-            result = await self._generator.generate(text)
+            result = await self._generator.generate(text, deadline=deadline)
         except Exception as exc:
             logger.error("Generator error: %s", exc)
-            return BotResponse(message="Sorry, I could not generate a flashcard.")
+            return self._release(
+                key, BotResponse(message="Sorry, I could not generate a flashcard.")
+            )
 
         flashcard = result.flashcard
         try:
-            await self._try_sync()
-            note_id = await self._anki.add_note(flashcard)
+            await self._try_sync(deadline)
+            note_id = await self._anki.add_note(flashcard, deadline=deadline)
         except Exception as exc:
             logger.error("Anki add failed: %s", exc)
-            return BotResponse(message="Failed to add flashcard to Anki.")
+            return self._release(key, BotResponse(message="Failed to add flashcard to Anki."))
+
+        added = AddResult(note_id=note_id, flashcard=flashcard, alternatives=result.alternatives)
+        self._state.record_note(text, added)
+        if user_id is not None and message_id is not None:
+            self._state.link_message(user_id, message_id, note_id)
+        self._state.forget_finished_requests(f"{_DELETE_REQUEST}:")
+        sync_warning = await self._try_sync(deadline)
+        response = _added_response(added, sync_warning)
+        self._state.finish_request(key, response, remember=True)
+        return response
+
+    async def _handle_update(
+        self,
+        record: NoteRecord,
+        text: str,
+        deadline: Deadline | None,
+        request_key: str | None = None,
+    ) -> BotResponse:
+        planned = self._planned(request_key)
+        if planned is not None:
+            [update] = planned
+            return await self._apply_update(
+                record, text, update.flashcard, update.alternatives, deadline, background_sync=False
+            )
+        current = record.result.flashcard
+        old_content, _ = split_reverse_directive(record.text)
+        new_content, reverse = split_reverse_directive(text)
+        if _dedup_text(old_content) == _dedup_text(new_content):
+            logger.info("Edit only changes reverse directive, skipping generation")
+            flashcard = replace(current, create_reverse=reverse)
+            alternatives = record.result.alternatives
+        else:
+            try:
+                result = await self._generator.generate(text, deadline=deadline)
+            except Exception as exc:
+                logger.error("Generator error: %s", exc)
+                return BotResponse(message="Sorry, I could not generate a flashcard.")
+            flashcard = result.flashcard
+            alternatives = result.alternatives
+
+        [update] = self._plan(
+            request_key,
+            [
+                AddResult(
+                    note_id=record.result.note_id, flashcard=flashcard, alternatives=alternatives
+                )
+            ],
+        )
+        return await self._apply_update(
+            record, text, update.flashcard, update.alternatives, deadline, background_sync=False
+        )
 
-        self._state.set_last_added(AddResult(note_id=note_id, flashcard=flashcard))
-        sync_warning = await self._try_sync()
-        return BotResponse(message=_format_add_message(flashcard, sync_warning))
+    async def _apply_update(
+        self,
+        record: NoteRecord,
+        text: str,
+        flashcard: Flashcard,
+        alternatives: tuple[Flashcard, ...],
+        deadline: Deadline | None,
+        *,
+        background_sync: bool,
+    ) -> BotResponse:
+        current = record.result.flashcard
+        note_id = record.result.note_id
+        sync_warning = None
+        if flashcard != current:
+            try:
+                await self._anki.update_note(
+                    note_id,
+                    flashcard,
+                    change_model=flashcard.create_reverse != current.create_reverse,
+                    deadline=deadline,
+                )
+            except Exception as exc:
+                logger.error("Anki update failed: %s", exc)
+                return BotResponse(message="Failed to update flashcard in Anki.")
+            if background_sync:
+                self._schedule_sync()
+            else:
+                sync_warning = await self._try_sync(deadline)
 
-    async def _handle_delete(self) -> BotResponse:
-        if self._state.last_added is None:
-            return BotResponse(message="Nothing to delete.")
+        updated = AddResult(note_id=note_id, flashcard=flashcard, alternatives=alternatives)
+        self._state.update_note(text, updated)
+        self._state.forget_finished_requests()
+        return BotResponse(
+            message=_format_flashcard_message("Flashcard updated:", flashcard, sync_warning),
+            note_id=note_id,
+            actions=_card_actions(updated),
+        )
 
-        last = self._state.last_added
+    async def _handle_delete(
+        self,
+        command: str,
+        user_id: int | None,
+        deadline: Deadline | None,
+        request_key: str | None = None,
+    ) -> BotResponse:
+        match = _DELETE_COMMAND.fullmatch(command)
+        if match is None:
+            return BotResponse(message=DELETE_USAGE)
+        if match["count"] is not None and int(match["count"]) < 1:
+            return BotResponse(message=DELETE_USAGE)
+        key = self._dedup_key(_DELETE_REQUEST, user_id, command)
+        planned = self._planned(request_key)
+        if planned is not None:
+            logger.info("Retrying planned delete of %d note(s)", len(planned))
+            return await self._delete(planned, deadline, background_sync=False, dedup_key=key)
+        duplicate = await self._claim(key, deadline)
+        if duplicate is not None:
+            if duplicate.message == STILL_WORKING:
+                return duplicate
+            logger.info("Duplicate delete command absorbed by dedup window")
+            self._state.forget_request(key)
+            return BotResponse(message=DELETE_REPEATED.format(command=command))
+        if match["count"] is not None:
+            count = int(match["count"])
+            targets = self._state.recent_notes(count)
+        elif match["amount"] is not None:
+            seconds = int(match["amount"]) * _UNIT_SECONDS[match["unit"].lower()]
+            targets = self._state.notes_since(time.time() - seconds)
+        else:
+            targets = self._state.recent_notes(1)
+        if not targets:
+            return self._release(key, BotResponse(message="Nothing to delete."))
+        targets = self._plan(request_key, targets)
+        return await self._delete(targets, deadline, background_sync=False, dedup_key=key)
+
+    async def _delete(
+        self,
+        targets: list[AddResult],
+        deadline: Deadline | None,
+        *,
+        background_sync: bool,
+        dedup_key: str | None = None,
+    ) -> BotResponse:
+        note_ids = [target.note_id for target in targets]
         try:
-            await self._try_sync()
-            await self._anki.delete_note(last.note_id)
+            await self._anki.delete_notes(note_ids, deadline=deadline)
         except Exception as exc:
             logger.error("Anki delete failed: %s", exc)
-            return BotResponse(message="Failed to delete flashcard from Anki.")
+            response = BotResponse(message="Failed to delete flashcard from Anki.")
+            return response if dedup_key is None else self._release(dedup_key, response)
+
+        sync_warning = None
+        if background_sync:
+            self._schedule_sync()
+        else:
+            sync_warning = await self._try_sync(deadline)
+        self._state.forget_notes(note_ids)
+        self._state.forget_finished_requests()
+        if len(targets) == 1:
+            message = _format_flashcard_message(
+                "Flashcard deleted:", targets[0].flashcard, sync_warning
+            )
+        else:
+            message = _format_delete_many_message(targets, sync_warning)
+        response = BotResponse(message=message)
+        if dedup_key is not None:
+            self._state.finish_request(dedup_key, response, remember=True)
+        return response
+
+    def _stored_response(self, request_key: str | None) -> BotResponse | None:
+        if request_key is None:
+            return None
+        response = self._state.operation_response(request_key)
+        if response is not None:
+            logger.info("Request already handled, returning its stored reply")
+        return response
+
+    def _finish(self, request_key: str | None, response: BotResponse) -> BotResponse:
+        if request_key is not None:
+            self._state.finish_operation(request_key, response)
+        return response
+
+    def _planned(self, request_key: str | None) -> list[AddResult] | None:
+        if request_key is None:
+            return None
+        return self._state.planned_notes(request_key)
 
-        sync_warning = await self._try_sync()
-        self._state.clear_last_added()
-        return BotResponse(message=_format_delete_message(last.flashcard, sync_warning))
+    def _plan(self, request_key: str | None, results: list[AddResult]) -> list[AddResult]:
+        if request_key is None:
+            return results
+        return self._state.plan_notes(request_key, results)
 
-    async def _try_sync(self) -> str | None:
+    def _dedup_key(self, kind: str, user_id: int | None, text: str) -> str:
+        return f"{kind}:{user_id}:{self._config.anki_deck}:{_dedup_text(text)}"
+
+    async def _claim(self, key: str, deadline: Deadline | None) -> BotResponse | None:
+        window = self._config.dedup_window_seconds
+        stale_after = self._config.request_deadline_seconds
+        while not self._state.claim_request(key, window, stale_after):
+            response = self._state.finished_request(key)
+            if response is not None:
+                return response
+            if deadline is not None and deadline.expired:
+                logger.warning("Gave up waiting for an identical request in another process")
+                return BotResponse(message=STILL_WORKING)
+            await asyncio.sleep(_DEDUP_POLL_SECONDS)
+        return None
+
+    def _release(self, key: str, response: BotResponse) -> BotResponse:
+        self._state.finish_request(key, response, remember=False)
+        return response
+
+    def _schedule_sync(self) -> None:
+        task = asyncio.create_task(self._try_sync())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _try_sync(self, deadline: Deadline | None = None) -> str | None:
+        if deadline is not None and deadline.remaining() < self._config.min_sync_budget_seconds:
+            logger.warning("Anki sync skipped, %.1fs of request budget left", deadline.remaining())
+            return "Warning: Anki sync skipped, request ran out of time."
         try:
-            await self._anki.sync()
+            await self._anki.sync(deadline=deadline)
         except Exception as exc:
             logger.warning("Anki sync failed: %s", exc)
             return "Warning: Anki sync failed."
         return None
 
 
-def _format_add_message(flashcard: Flashcard, sync_warning: str | None) -> str:
+def _added_response(result: AddResult, sync_warning: str | None) -> BotResponse:
+    return BotResponse(
+        message=_format_flashcard_message("Flashcard added:", result.flashcard, sync_warning),
+        note_id=result.note_id,
+        actions=_card_actions(result),
+    )
+
+
+def _card_actions(result: AddResult) -> tuple[str, ...]:
+    if result.alternatives:
+        return (*CARD_ACTIONS, ACTION_NEXT_VARIANT)
+    return CARD_ACTIONS
+
+
+def _is_delete_command(text: str) -> bool:
+    return _DELETE_PREFIX.match(text) is not None
+
+
+def _dedup_text(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def _format_flashcard_message(title: str, flashcard: Flashcard, sync_warning: str | None) -> str:
     lines = [
-        "Flashcard added:",
+        title,
         f"Front: {flashcard.front}",
         f"Back: {flashcard.back}",
         f"Reverse card: {'yes' if flashcard.create_reverse else 'no'}",
@@ -91,13 +483,9 @@ def _format_add_message(flashcard: Flashcard, sync_warning: str | None) -> str:
     return "\n".join(lines)
 
 
-def _format_delete_message(flashcard: Flashcard, sync_warning: str | None) -> str:
-    lines = [
-        "Flashcard deleted:",
-        f"Front: {flashcard.front}",
-        f"Back: {flashcard.back}",
-        f"Reverse card: {'yes' if flashcard.create_reverse else 'no'}",
-    ]
+def _format_delete_many_message(targets: list[AddResult], sync_warning: str | None) -> str:
+    lines = [f"Flashcards deleted: {len(targets)}"]
+    lines.extend(f"- {target.flashcard.front} / {target.flashcard.back}" for target in targets)
     if sync_warning:
         lines.append(sync_warning)
     return "\n".join(lines)
@@ -1,16 +1,277 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import json
+import sqlite3
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
 
-from app.models import AddResult
+from app.models import (
+    AddResult,
+    BotResponse,
+    Flashcard,
+    NoteRecord,
+    dump_response,
+    load_response,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    note_id INTEGER PRIMARY KEY,
+    source_text TEXT NOT NULL,
+    front TEXT NOT NULL,
+    back TEXT NOT NULL,
+    create_reverse INTEGER NOT NULL,
+    added_at REAL NOT NULL,
+    alternatives TEXT NOT NULL DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    note_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS messages_note_id ON messages (note_id);
+CREATE INDEX IF NOT EXISTS notes_added_at ON notes (added_at);
+CREATE TABLE IF NOT EXISTS operations (
+    request_key TEXT PRIMARY KEY,
+    plan TEXT,
+    response TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS requests (
+    dedup_key TEXT PRIMARY KEY,
+    claimed_at REAL NOT NULL,
+    finished_at REAL,
+    response TEXT
+);
+"""
+_NOTE_COLUMNS = "n.note_id, n.source_text, n.front, n.back, n.create_reverse, n.alternatives"
+DEFAULT_HISTORY_LIMIT = 200
+OPERATION_RETENTION_SECONDS = 24 * 3600
 
 
 @dataclass
 class StateStore:
-    last_added: AddResult | None = None
+    path: Path | None = None
+    history_limit: int = DEFAULT_HISTORY_LIMIT
+    _db: sqlite3.Connection | None = field(default=None, init=False, repr=False)
+
+    @property
+    def last_added(self) -> AddResult | None:
+        history = self.recent_notes(1)
+        return history[0] if history else None
+
+    def recent_notes(self, limit: int) -> list[AddResult]:
+        rows = self._select_notes("ORDER BY n.added_at DESC, n.note_id DESC LIMIT ?", (limit,))
+        return [record.result for record in rows]
+
+    def notes_since(self, timestamp: float) -> list[AddResult]:
+        rows = self._select_notes(
+            "WHERE n.added_at >= ? ORDER BY n.added_at DESC, n.note_id DESC", (timestamp,)
+        )
+        return [record.result for record in rows]
+
+    def record_note(self, text: str, result: AddResult) -> None:
+        flashcard = result.flashcard
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO notes "
+                "(note_id, source_text, front, back, create_reverse, added_at, alternatives) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    result.note_id,
+                    text,
+                    flashcard.front,
+                    flashcard.back,
+                    int(flashcard.create_reverse),
+                    time.time(),
+                    _dump_alternatives(result),
+                ),
+            )
+            db.execute(
+                "DELETE FROM notes WHERE note_id NOT IN "
+                "(SELECT note_id FROM notes ORDER BY added_at DESC, note_id DESC LIMIT ?)",
+                (self.history_limit,),
+            )
+            db.execute("DELETE FROM messages WHERE note_id NOT IN (SELECT note_id FROM notes)")
+
+    def update_note(self, text: str, result: AddResult) -> None:
+        flashcard = result.flashcard
+        with self._connection() as db:
+            db.execute(
+                "UPDATE notes SET source_text = ?, front = ?, back = ?, create_reverse = ?, "
+                "alternatives = ? WHERE note_id = ?",
+                (
+                    text,
+                    flashcard.front,
+                    flashcard.back,
+                    int(flashcard.create_reverse),
+                    _dump_alternatives(result),
+                    result.note_id,
+                ),
+            )
+
+    def forget_notes(self, note_ids: list[int]) -> None:
+        params = [(note_id,) for note_id in note_ids]
+        with self._connection() as db:
+            db.executemany("DELETE FROM messages WHERE note_id = ?", params)
+            db.executemany("DELETE FROM notes WHERE note_id = ?", params)
+
+    def link_message(self, user_id: int, message_id: int, note_id: int) -> None:
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO messages (user_id, message_id, note_id) VALUES (?, ?, ?)",
+                (user_id, message_id, note_id),
+            )
+
+    def note_for_message(self, user_id: int, message_id: int) -> NoteRecord | None:
+        rows = self._select_notes(
+            "JOIN messages m ON n.note_id = m.note_id WHERE m.user_id = ? AND m.message_id = ?",
+            (user_id, message_id),
+        )
+        return rows[0] if rows else None
+
+    def get_note(self, note_id: int) -> NoteRecord | None:
+        rows = self._select_notes("WHERE n.note_id = ?", (note_id,))
+        return rows[0] if rows else None
+
+    def planned_notes(self, request_key: str) -> list[AddResult] | None:
+        row = (
+            self._connection()
+            .execute("SELECT plan FROM operations WHERE request_key = ?", (request_key,))
+            .fetchone()
+        )
+        if row is None or row[0] is None:
+            return None
+        return [_load_result(item) for item in json.loads(row[0])]
+
+    def plan_notes(self, request_key: str, results: list[AddResult]) -> list[AddResult]:
+        plan = json.dumps([asdict(result) for result in results], ensure_ascii=False)
+        now = time.time()
+        with self._connection() as db:
+            db.execute(
+                "DELETE FROM operations WHERE created_at < ?",
+                (now - OPERATION_RETENTION_SECONDS,),
+            )
+            db.execute(
+                "INSERT INTO operations (request_key, plan, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (request_key) DO UPDATE SET plan = excluded.plan "
+                "WHERE operations.plan IS NULL",
+                (request_key, plan, now),
+            )
+        planned = self.planned_notes(request_key)
+        return results if planned is None else planned
+
+    def finish_operation(self, request_key: str, response: BotResponse) -> None:
+        with self._connection() as db:
+            db.execute(
+                "INSERT INTO operations (request_key, response, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (request_key) DO UPDATE SET response = excluded.response",
+                (request_key, dump_response(response), time.time()),
+            )
+
+    def operation_response(self, request_key: str) -> BotResponse | None:
+        row = (
+            self._connection()
+            .execute("SELECT response FROM operations WHERE request_key = ?", (request_key,))
+            .fetchone()
+        )
+        if row is None or row[0] is None:
+            return None
+        return load_response(row[0])
+
+    def claim_request(self, dedup_key: str, window: float, stale_after: float) -> bool:
+        now = time.time()
+        with self._connection() as db:
+            db.execute(
+                "DELETE FROM requests WHERE finished_at < ? OR claimed_at < ?",
+                (now - window, now - OPERATION_RETENTION_SECONDS),
+            )
+            cursor = db.execute(
+                "INSERT INTO requests (dedup_key, claimed_at) VALUES (?, ?) "
+                "ON CONFLICT (dedup_key) DO UPDATE SET claimed_at = excluded.claimed_at, "
+                "finished_at = NULL, response = NULL "
+                "WHERE requests.finished_at IS NULL AND requests.claimed_at < ?",
+                (dedup_key, now, now - stale_after),
+            )
+        return cursor.rowcount == 1
+
+    def finished_request(self, dedup_key: str) -> BotResponse | None:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT response FROM requests WHERE dedup_key = ? AND finished_at IS NOT NULL",
+                (dedup_key,),
+            )
+            .fetchone()
+        )
+        return None if row is None else load_response(row[0])
+
+    def finish_request(self, dedup_key: str, response: BotResponse, *, remember: bool) -> None:
+        now = time.time()
+        with self._connection() as db:
+            db.execute(
+                "INSERT INTO requests (dedup_key, claimed_at, finished_at, response) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (dedup_key) DO UPDATE SET "
+                "finished_at = excluded.finished_at, response = excluded.response",
+                (dedup_key, now, now if remember else 0.0, dump_response(response)),
+            )
+
+    def forget_request(self, dedup_key: str) -> None:
+        with self._connection() as db:
+            db.execute("DELETE FROM requests WHERE dedup_key = ?", (dedup_key,))
+
+    def forget_finished_requests(self, prefix: str = "") -> None:
+        with self._connection() as db:
+            db.execute(
+                "DELETE FROM requests "
+                "WHERE finished_at IS NOT NULL AND substr(dedup_key, 1, ?) = ?",
+                (len(prefix), prefix),
+            )
+
+    def _select_notes(self, clause: str, params: tuple) -> list[NoteRecord]:
+        rows = self._connection().execute(f"SELECT {_NOTE_COLUMNS} FROM notes n {clause}", params)
+        return [_row_to_record(row) for row in rows]
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            if self.path is None:
+                self._db = sqlite3.connect(":memory:")
+            else:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(self.path), timeout=10.0)
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+            _migrate(self._db)
+        return self._db
+
+
+def _migrate(db: sqlite3.Connection) -> None:
+    columns = {row[1] for row in db.execute("PRAGMA table_info(notes)")}
+    if "alternatives" not in columns:
+        with db:
+            db.execute("ALTER TABLE notes ADD COLUMN alternatives TEXT NOT NULL DEFAULT '[]'")
+
+
+def _dump_alternatives(result: AddResult) -> str:
+    return json.dumps([asdict(item) for item in result.alternatives], ensure_ascii=False)
+
+
+def _load_result(data: dict) -> AddResult:
+    return AddResult(
+        note_id=data["note_id"],
+        flashcard=Flashcard(**data["flashcard"]),
+        alternatives=tuple(Flashcard(**item) for item in data["alternatives"]),
+    )
 
-    def set_last_added(self, result: AddResult) -> None:
-        self.last_added = result
 
-    def clear_last_added(self) -> None:
-        self.last_added = None
+def _row_to_record(row: tuple) -> NoteRecord:
+    note_id, text, front, back, create_reverse, alternatives = row
+    flashcard = Flashcard(front=front, back=back, create_reverse=bool(create_reverse))
+    result = AddResult(
+        note_id=note_id,
+        flashcard=flashcard,
+        alternatives=tuple(Flashcard(**item) for item in json.loads(alternatives)),
+    )
+    return NoteRecord(text=text, result=result)
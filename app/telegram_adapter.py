@@ -1,17 +1,52 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
+from collections.abc import Awaitable, Callable
 
-from telegram import Update
-from telegram.ext import Application, ApplicationBuilder, ContextTypes, MessageHandler, filters
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import (
+    Application,
+    ApplicationBuilder,
+    CallbackQueryHandler,
+    ContextTypes,
+    MessageHandler,
+    filters,
+)
 
 from app.config import Config
-from app.service import FlashcardService
+from app.deadline import Deadline
+from app.jobs import JOB_ACTION, JOB_EDIT, JOB_TEXT, JobStore
+from app.models import BotResponse
+from app.service import (
+    ACTION_NEXT_VARIANT,
+    ACTION_REGENERATE,
+    ACTION_REVERSE,
+    ACTION_SWAP,
+    ACTION_UNDO,
+    FlashcardService,
+)
 
 logger = logging.getLogger(__name__)
 
+JOB_FAILED_MESSAGE = "Sorry, something went wrong while processing your message."
 
-def build_application(config: Config, service: FlashcardService) -> Application:
+ACTION_LABELS = {
+    ACTION_UNDO: "Undo",
+    ACTION_REVERSE: "Toggle reverse",
+    ACTION_SWAP: "Swap sides",
+    ACTION_REGENERATE: "Regenerate",
+    ACTION_NEXT_VARIANT: "Next variant",
+}
+
+
+def build_application(
+    config: Config,
+    service: FlashcardService,
+    post_init: Callable[[Application], Awaitable[None]] | None = None,
+) -> Application:
     async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if update.effective_message is None or update.effective_user is None:
             return
@@ -19,12 +54,208 @@ def build_application(config: Config, service: FlashcardService) -> Application:
         if text is None:
             return
         logger.info("Telegram message received (user_id=%s)", update.effective_user.id)
-        response = await service.handle_text(text, user_id=update.effective_user.id)
+        response = await service.handle_text(
+            text,
+            user_id=update.effective_user.id,
+            message_id=update.effective_message.message_id,
+            deadline=Deadline.after(config.request_deadline_seconds),
+        )
+        if response.ignored or not response.message:
+            return
+        logger.info("Telegram response sending (user_id=%s)", update.effective_user.id)
+        await update.effective_message.reply_text(
+            response.message, reply_markup=build_keyboard(response)
+        )
+
+    async def handle_edited_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if update.edited_message is None or update.effective_user is None:
+            return
+        text = update.edited_message.text
+        if text is None:
+            return
+        logger.info("Telegram edited message received (user_id=%s)", update.effective_user.id)
+        response = await service.handle_edit(
+            text,
+            user_id=update.effective_user.id,
+            message_id=update.edited_message.message_id,
+            deadline=Deadline.after(config.request_deadline_seconds),
+        )
         if response.ignored or not response.message:
             return
         logger.info("Telegram response sending (user_id=%s)", update.effective_user.id)
-        await update.effective_message.reply_text(response.message)
+        await update.edited_message.reply_text(
+            response.message, reply_markup=build_keyboard(response)
+        )
 
-    application = ApplicationBuilder().token(config.telegram_token).build()
-    application.add_handler(MessageHandler(filters.TEXT, handle_message))
+    async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        if query is None or query.data is None or update.effective_user is None:
+            return
+        deadline = Deadline.after(config.request_deadline_seconds)
+        try:
+            await query.answer()
+        except BadRequest as exc:
+            logger.warning("Telegram callback query could not be answered: %s", exc)
+        parsed = parse_callback_data(query.data)
+        if parsed is None:
+            return
+        action, note_id = parsed
+        logger.info(
+            "Telegram card action received (user_id=%s, action=%s)",
+            update.effective_user.id,
+            action,
+        )
+        response = await service.handle_action(
+            action, note_id, user_id=update.effective_user.id, deadline=deadline
+        )
+        if response.ignored or not response.message:
+            return
+        await query.edit_message_text(response.message, reply_markup=build_keyboard(response))
+
+    builder = ApplicationBuilder().token(config.telegram_token)
+    if post_init is not None:
+        builder = builder.post_init(post_init)
+    application = builder.build()
+    application.add_handler(
+        MessageHandler(filters.TEXT & filters.UpdateType.MESSAGE, handle_message)
+    )
+    application.add_handler(
+        MessageHandler(filters.TEXT & filters.UpdateType.EDITED_MESSAGE, handle_edited_message)
+    )
+    application.add_handler(CallbackQueryHandler(handle_callback, block=False))
     return application
+
+
+def build_frontend_application(
+    config: Config, store: JobStore, poll_interval: float = 0.5
+) -> Application:
+    async def enqueue_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        message = update.effective_message
+        user = update.effective_user
+        if message is None or user is None or message.text is None:
+            return
+        if user.id != config.allowed_user_id:
+            return
+        kind = JOB_EDIT if update.edited_message is not None else JOB_TEXT
+        payload = {
+            "text": message.text,
+            "user_id": user.id,
+            "chat_id": message.chat_id,
+            "message_id": message.message_id,
+            "expires_at": time.time() + config.request_deadline_seconds,
+        }
+        if store.enqueue(
+            kind, payload, dedup_key=f"update:{update.update_id}", order_key=f"user:{user.id}"
+        ):
+            logger.info("Telegram job queued (user_id=%s, kind=%s)", user.id, kind)
+
+    async def enqueue_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        user = update.effective_user
+        if query is None or query.data is None or user is None:
+            return
+        try:
+            await query.answer()
+        except BadRequest as exc:
+            logger.warning("Telegram callback query could not be answered: %s", exc)
+        parsed = parse_callback_data(query.data)
+        if parsed is None or user.id != config.allowed_user_id or query.message is None:
+            return
+        action, note_id = parsed
+        payload = {
+            "action": action,
+            "note_id": note_id,
+            "user_id": user.id,
+            "chat_id": query.message.chat_id,
+            "message_id": query.message.message_id,
+            "expires_at": time.time() + config.request_deadline_seconds,
+        }
+        if store.enqueue(
+            JOB_ACTION, payload, dedup_key=f"update:{update.update_id}", order_key=f"note:{note_id}"
+        ):
+            logger.info("Telegram job queued (user_id=%s, kind=%s)", user.id, JOB_ACTION)
+
+    delivery: list[asyncio.Task[None]] = []
+
+    async def deliver_loop(bot: Bot) -> None:
+        while True:
+            try:
+                delivered = await deliver_finished_jobs(bot, store)
+            except Exception as exc:
+                logger.error("Job delivery failed: %s", exc)
+                delivered = 0
+            if not delivered:
+                await asyncio.sleep(poll_interval)
+
+    async def start_delivery(application: Application) -> None:
+        delivery.append(asyncio.create_task(deliver_loop(application.bot)))
+
+    async def stop_delivery(application: Application) -> None:
+        for task in delivery:
+            task.cancel()
+
+    application = (
+        ApplicationBuilder()
+        .token(config.telegram_token)
+        .post_init(start_delivery)
+        .post_stop(stop_delivery)
+        .build()
+    )
+    application.add_handler(
+        MessageHandler(
+            filters.TEXT & (filters.UpdateType.MESSAGE | filters.UpdateType.EDITED_MESSAGE),
+            enqueue_message,
+        )
+    )
+    application.add_handler(CallbackQueryHandler(enqueue_callback))
+    return application
+
+
+async def deliver_finished_jobs(bot: Bot, store: JobStore) -> int:
+    delivered = 0
+    for job in store.finished():
+        response = job.response or BotResponse(message=JOB_FAILED_MESSAGE)
+        payload = job.payload
+        if not response.ignored and response.message:
+            try:
+                if job.kind == JOB_ACTION and job.response is not None:
+                    await bot.edit_message_text(
+                        response.message,
+                        chat_id=payload["chat_id"],
+                        message_id=payload["message_id"],
+                        reply_markup=build_keyboard(response),
+                    )
+                else:
+                    await bot.send_message(
+                        payload["chat_id"],
+                        response.message,
+                        reply_to_message_id=payload["message_id"],
+                        reply_markup=build_keyboard(response),
+                    )
+            except BadRequest as exc:
+                logger.error("Telegram rejected job response (job_id=%s): %s", job.id, exc)
+            except TelegramError as exc:
+                logger.warning("Telegram delivery failed, will retry (job_id=%s): %s", job.id, exc)
+                continue
+        store.mark_delivered(job.id)
+        delivered += 1
+    return delivered
+
+
+def build_keyboard(response: BotResponse) -> InlineKeyboardMarkup | None:
+    if response.note_id is None or not response.actions:
+        return None
+    buttons = [
+        InlineKeyboardButton(
+            ACTION_LABELS.get(action, action), callback_data=f"{action}:{response.note_id}"
+        )
+        for action in response.actions
+    ]
+    return InlineKeyboardMarkup([buttons[i : i + 2] for i in range(0, len(buttons), 2)])
+
+
+def parse_callback_data(data: str) -> tuple[str, int] | None:
+    action, _, note_id = data.partition(":")
+    if not action or not note_id.isdigit():
+        return None
+    return action, int(note_id)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from app.config import Config
+from app.deadline import Deadline
+from app.jobs import JOB_ACTION, JOB_EDIT, JOB_TEXT, Job, JobStore
+from app.models import BotResponse
+from app.service import FlashcardService
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    def __init__(
+        self,
+        config: Config,
+        service: FlashcardService,
+        store: JobStore,
+        worker_id: str,
+        *,
+        poll_interval: float = 0.5,
+    ) -> None:
+        self._config = config
+        self._service = service
+        self._store = store
+        self._worker_id = worker_id
+        self._poll_interval = poll_interval
+
+    async def run(self, concurrency: int = 1) -> None:
+        logger.info("Worker started (worker_id=%s, concurrency=%s)", self._worker_id, concurrency)
+        await asyncio.gather(*(self._loop() for _ in range(concurrency)))
+
+    async def run_once(self) -> bool:
+        job = self._store.claim(self._worker_id)
+        if job is None:
+            return False
+        await self._process(job)
+        return True
+
+    async def _loop(self) -> None:
+        while True:
+            if not await self.run_once():
+                await asyncio.sleep(self._poll_interval)
+
+    async def _process(self, job: Job) -> None:
+        logger.info("Job started (job_id=%s, kind=%s)", job.id, job.kind)
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            response = await self._dispatch(job)
+        except Exception as exc:
+            logger.error("Job failed (job_id=%s): %s", job.id, exc)
+            self._store.fail(job.id, self._worker_id, str(exc))
+            return
+        finally:
+            heartbeat.cancel()
+        if not self._store.complete(job.id, self._worker_id, response):
+            logger.warning("Job lease lost before completion (job_id=%s)", job.id)
+            return
+        logger.info("Job completed (job_id=%s)", job.id)
+
+    async def _dispatch(self, job: Job) -> BotResponse:
+        payload = job.payload
+        expires_at = payload.get("expires_at")
+        if expires_at is None:
+            deadline = Deadline.after(self._config.request_deadline_seconds)
+        else:
+            deadline = Deadline.until(expires_at)
+        request_key = f"job:{job.id}"
+        if job.kind == JOB_TEXT:
+            return await self._service.handle_text(
+                payload["text"],
+                user_id=payload["user_id"],
+                message_id=payload["message_id"],
+                deadline=deadline,
+                request_key=request_key,
+            )
+        if job.kind == JOB_EDIT:
+            return await self._service.handle_edit(
+                payload["text"],
+                user_id=payload["user_id"],
+                message_id=payload["message_id"],
+                deadline=deadline,
+                request_key=request_key,
+            )
+        if job.kind == JOB_ACTION:
+            return await self._service.handle_action(
+                payload["action"],
+                payload["note_id"],
+                user_id=payload["user_id"],
+                deadline=deadline,
+                request_key=request_key,
+            )
+        raise ValueError(f"Unknown job kind: {job.kind}")
+
+    async def _heartbeat(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(self._store.lease_seconds / 3)
+            if not self._store.heartbeat(job.id, self._worker_id):
+                logger.warning("Job lease lost (job_id=%s)", job.id)
+                return
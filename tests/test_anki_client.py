@@ -5,8 +5,9 @@ import json
 import httpx
 import pytest
 
-from app.anki_client import AnkiClientError, AnkiMcpClient, _extract_result
-from app.models import Flashcard
+from app.anki_client import AnkiClientError, AnkiMcpClient, AnkiSchemaError, _extract_result
+from app.deadline import DEADLINE_MISSES, Deadline, DeadlineExceeded
+from app.models import Flashcard, NoteType
 
 
 def _sse(payload: dict) -> str:
@@ -72,3 +73,150 @@ def test_extract_result_raises_for_tool_error() -> None:
 
     with pytest.raises(AnkiClientError, match="Unknown tool: addNote"):
         _extract_result(response_text)
+
+
+@pytest.mark.asyncio
+async def test_update_note_switches_tool_when_model_changes() -> None:
+    calls: list[tuple[str, dict]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content.decode("utf-8"))
+        if body["method"] == "initialize":
+            return httpx.Response(
+                200,
+                text=_sse({"jsonrpc": "2.0", "id": 1, "result": {}}),
+                headers={"mcp-session-id": "sid"},
+            )
+        calls.append((body["params"]["name"], body["params"]["arguments"]))
+        return httpx.Response(
+            200, text=_sse({"jsonrpc": "2.0", "id": 2, "result": {"structuredContent": {}}})
+        )
+
+    client = AnkiMcpClient("http://anki", transport=httpx.MockTransport(handler))
+    flashcard = Flashcard(front="F", back="B", create_reverse=True)
+    await client.update_note(5, flashcard)
+    await client.update_note(5, flashcard, change_model=True)
+
+    fields = {"Front": "F", "Back": "B"}
+    assert calls == [
+        ("update_note_fields", {"note": {"id": 5, "fields": fields}}),
+        (
+            "update_note_model",
+            {"note": {"id": 5, "fields": fields, "modelName": "Basic (and reversed card)"}},
+        ),
+    ]
+
+
+def _schema_handler(calls: list[tuple[str, dict]], tools: dict[str, dict]):
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content.decode("utf-8"))
+        if body["method"] == "initialize":
+            return httpx.Response(
+                200,
+                text=_sse({"jsonrpc": "2.0", "id": 1, "result": {}}),
+                headers={"mcp-session-id": "sid"},
+            )
+        name = body["params"]["name"]
+        arguments = body["params"]["arguments"]
+        calls.append((name, arguments))
+        result = tools[name]
+        if name == "model_field_names":
+            result = {"fieldNames": result[arguments["modelName"]]}
+        return httpx.Response(
+            200, text=_sse({"jsonrpc": "2.0", "id": 2, "result": {"structuredContent": result}})
+        )
+
+    return handler
+
+
+VOCAB = NoteType(
+    model_name="Vocab", fields=(("Word", "{front}"), ("Meaning", "{back}"), ("Audio", ""))
+)
+SCHEMA_TOOLS = {
+    "list_decks": {"decks": [{"name": "Default"}, {"name": "Polish"}]},
+    "model_names": {"modelNames": ["Basic", "Vocab"]},
+    "model_field_names": {"Vocab": ["Word", "Meaning", "Audio"]},
+    "add_note": {"note_id": 7},
+}
+
+
+@pytest.mark.asyncio
+async def test_schema_is_cached_until_invalidated() -> None:
+    calls: list[tuple[str, dict]] = []
+    client = AnkiMcpClient(
+        "http://anki",
+        deck_name="Polish",
+        transport=httpx.MockTransport(_schema_handler(calls, SCHEMA_TOOLS)),
+        note_type=VOCAB,
+        reverse_note_type=VOCAB,
+    )
+
+    await client.validate_schema()
+    await client.validate_schema()
+    assert [name for name, _ in calls] == ["list_decks", "model_names", "model_field_names"]
+
+    client.invalidate_schema()
+    await client.get_schema()
+    assert len(calls) == 6
+
+
+@pytest.mark.asyncio
+async def test_validate_schema_reports_missing_deck_model_and_fields() -> None:
+    calls: list[tuple[str, dict]] = []
+    broken = NoteType(model_name="Vocab", fields=(("Word", "{front}"), ("Example", "{back}")))
+    client = AnkiMcpClient(
+        "http://anki",
+        deck_name="Spanish",
+        transport=httpx.MockTransport(_schema_handler(calls, SCHEMA_TOOLS)),
+        note_type=broken,
+        reverse_note_type=NoteType(model_name="Cloze", fields=(("Text", "{front}"),)),
+    )
+
+    with pytest.raises(AnkiSchemaError) as exc_info:
+        await client.validate_schema()
+
+    message = str(exc_info.value)
+    assert "deck 'Spanish'" in message
+    assert "'Vocab' has no fields Example" in message
+    assert "note type 'Cloze' does not exist" in message
+
+
+@pytest.mark.asyncio
+async def test_add_note_uses_configured_note_type() -> None:
+    calls: list[tuple[str, dict]] = []
+    client = AnkiMcpClient(
+        "http://anki",
+        transport=httpx.MockTransport(_schema_handler(calls, SCHEMA_TOOLS)),
+        note_type=VOCAB,
+    )
+
+    await client.add_note(Flashcard(front="kot", back="кошка", create_reverse=False))
+
+    assert calls[0][1]["model_name"] == "Vocab"
+    assert calls[0][1]["fields"] == {"Word": "kot", "Meaning": "кошка", "Audio": ""}
+
+
+@pytest.mark.asyncio
+async def test_expired_deadline_skips_request_and_counts_miss() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise AssertionError("No request expected")
+
+    client = AnkiMcpClient("http://anki", transport=httpx.MockTransport(handler))
+    before = DEADLINE_MISSES["anki.add_note"]
+
+    with pytest.raises(DeadlineExceeded):
+        await client.add_note(
+            Flashcard(front="F", back="B", create_reverse=False), deadline=Deadline.after(0)
+        )
+
+    assert DEADLINE_MISSES["anki.add_note"] == before + 1
+
+
+def test_note_type_render_does_not_expand_placeholders_in_card_text() -> None:
+    flashcard = Flashcard(front="use {back} here", back="{front}", create_reverse=False)
+
+    assert VOCAB.render(flashcard) == {
+        "Word": "use {back} here",
+        "Meaning": "{front}",
+        "Audio": "",
+    }
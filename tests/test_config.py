@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from app.config import load_config
+from app.models import REVERSED_NOTE_TYPE
+
+
+def test_load_config_note_types(tmp_path: Path) -> None:
+    path = tmp_path / "config.yaml"
+    path.write_text(
+        "TG_API_TOKEN: token\n"
+        "TG_USER_ID: 1\n"
+        "ANKI_NOTE_TYPE:\n"
+        "  model: Cloze\n"
+        "  fields:\n"
+        "    Text: '{{c1::{front}}}'\n"
+        "    Back Extra: '{back}'\n"
+    )
+
+    config = load_config(path)
+
+    assert config.note_type.model_name == "Cloze"
+    assert config.note_type.fields == (("Text", "{{c1::{front}}}"), ("Back Extra", "{back}"))
+    assert hash(config) == hash(load_config(path))
+    assert config.reverse_note_type == REVERSED_NOTE_TYPE
+
+
+def test_load_config_rejects_note_type_without_fields(tmp_path: Path) -> None:
+    path = tmp_path / "config.yaml"
+    path.write_text("TG_API_TOKEN: token\nTG_USER_ID: 1\nANKI_NOTE_TYPE:\n  model: Cloze\n")
+
+    with pytest.raises(ValueError, match="ANKI_NOTE_TYPE.fields"):
+        load_config(path)
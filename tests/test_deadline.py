@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from app import generator
+from app.deadline import DEADLINE_MISSES, Deadline, DeadlineExceeded, stage_timeout
+from app.generator import GeneratorError
+
+
+def test_stage_timeout_is_capped_by_remaining_budget() -> None:
+    assert stage_timeout(None, "generate", 15.0) == 15.0
+    assert stage_timeout(Deadline.after(60), "generate", 15.0) == 15.0
+    assert stage_timeout(Deadline.after(2), "generate", 15.0) <= 2.0
+
+
+def test_stage_timeout_counts_miss_when_budget_is_spent() -> None:
+    before = DEADLINE_MISSES["generate"]
+
+    with pytest.raises(DeadlineExceeded):
+        stage_timeout(Deadline.after(0), "generate", 15.0)
+
+    assert DEADLINE_MISSES["generate"] == before + 1
+
+
+class StalledCopilotClient:
+    stopped = False
+
+    async def start(self) -> None:
+        await asyncio.sleep(10)
+
+    async def stop(self) -> None:
+        StalledCopilotClient.stopped = True
+
+
+@pytest.mark.asyncio
+async def test_copilot_startup_is_bounded_by_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(generator, "CopilotClient", StalledCopilotClient)
+    monkeypatch.setattr(generator, "SessionEventType", object())
+    monkeypatch.setattr(generator, "PermissionHandler", object())
+    before = DEADLINE_MISSES["generate"]
+
+    with pytest.raises(GeneratorError, match="timed out"):
+        await generator.CopilotGenerator().complete("word", Deadline.after(0.05))
+    await asyncio.sleep(0)
+
+    assert DEADLINE_MISSES["generate"] == before + 1
+    assert StalledCopilotClient.stopped
+
+
+def test_deadline_until_wall_clock_time() -> None:
+    assert 4.0 < Deadline.until(time.time() + 5).remaining() <= 5.0
+    assert Deadline.until(time.time() - 1).expired
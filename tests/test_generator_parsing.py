@@ -4,7 +4,13 @@ import json
 
 import pytest
 
-from app.generator import GeneratorError, parse_flashcard_json
+from app.generator import (
+    GeneratorError,
+    build_prompt,
+    parse_flashcard_candidates,
+    parse_flashcard_json,
+    split_reverse_directive,
+)
 
 
 def test_parse_flashcard_json_success() -> None:
@@ -23,3 +29,36 @@ def test_parse_flashcard_json_failure(caplog: pytest.LogCaptureFixture) -> None:
         parse_flashcard_json("not json")
 
     assert any("Copilot JSON parse error" in record.message for record in caplog.records)
+
+
+def test_split_reverse_directive() -> None:
+    assert split_reverse_directive("Zuchwalstwo rev") == ("Zuchwalstwo", True)
+    assert split_reverse_directive("ВВП  r") == ("ВВП", True)
+    assert split_reverse_directive("foo с обратной") == ("foo", True)
+    assert split_reverse_directive("rewards program") == ("rewards program", False)
+
+
+def test_parse_flashcard_candidates_skips_invalid_alternatives() -> None:
+    payload = json.dumps(
+        [
+            {"front": "A", "back": "B", "create_reverse": False},
+            {"front": "", "back": "B", "create_reverse": False},
+            {"front": "A", "back": "B", "create_reverse": False},
+            {"front": "C", "back": "D", "create_reverse": False},
+        ]
+    )
+
+    flashcards = parse_flashcard_candidates(payload)
+
+    assert [card.front for card in flashcards] == ["A", "C"]
+    assert parse_flashcard_json(payload).front == "A"
+
+
+def test_parse_flashcard_candidates_requires_valid_first() -> None:
+    with pytest.raises(GeneratorError):
+        parse_flashcard_candidates(json.dumps([{"front": "A"}]))
+
+
+def test_build_prompt_asks_for_alternatives() -> None:
+    assert "JSON array of exactly 3" in build_prompt("warehouse", candidates=3)
+    assert "ALTERNATIVES" not in build_prompt("warehouse")
@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+from app.config import Config
+from app.deadline import Deadline
+from app.generator import Generator, GeneratorResult, parse_flashcard_json
+from app.jobs import JOB_ACTION, JOB_EDIT, JOB_TEXT, JobStore
+from app.models import BotResponse, Flashcard
+from app.service import CARD_ACTIONS, FlashcardService
+from app.state import StateStore
+from app.worker import Worker
+
+
+class FakeGenerator(Generator):
+    async def generate(self, text: str, deadline: Deadline | None = None):
+        raw = '{"front":"Hola amigo","back":"Privet","create_reverse":false}'
+        return GeneratorResult(flashcard=parse_flashcard_json(raw), raw_output=raw)
+
+
+class WorkerCrash(BaseException):
+    pass
+
+
+class FakeAnki:
+    def __init__(self) -> None:
+        self.added: list[Flashcard] = []
+        self.deleted: list[int] = []
+        self.updated: list[tuple[int, Flashcard]] = []
+        self.crash_after_write = False
+
+    async def add_note(self, flashcard: Flashcard, *, deadline: Deadline | None = None) -> int:
+        self.added.append(flashcard)
+        return 100 + len(self.added)
+
+    async def delete_notes(self, note_ids: list[int], *, deadline: Deadline | None = None) -> None:
+        self.deleted.extend(note_ids)
+        self._maybe_crash()
+
+    async def update_note(
+        self,
+        note_id: int,
+        flashcard: Flashcard,
+        *,
+        change_model: bool = False,
+        deadline: Deadline | None = None,
+    ) -> None:
+        self.updated.append((note_id, flashcard))
+        self._maybe_crash()
+
+    def _maybe_crash(self) -> None:
+        if self.crash_after_write:
+            self.crash_after_write = False
+            raise WorkerCrash
+
+    async def sync(self, *, deadline: Deadline | None = None) -> None:
+        return None
+
+
+def make_service(tmp_path: Path, anki: FakeAnki) -> FlashcardService:
+    config = Config(telegram_token="token", allowed_user_id=1, anki_mcp_url="http://anki")
+    return FlashcardService(
+        config, FakeGenerator(), anki, StateStore(path=tmp_path / "state.sqlite3")
+    )
+
+
+def test_enqueue_ignores_duplicate_updates(tmp_path: Path) -> None:
+    store = JobStore(tmp_path / "jobs.sqlite3")
+
+    assert store.enqueue(JOB_TEXT, {"text": "hola"}, dedup_key="update:1") is True
+    assert store.enqueue(JOB_TEXT, {"text": "hola"}, dedup_key="update:1") is False
+
+
+def test_completed_job_is_delivered_once(tmp_path: Path) -> None:
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.enqueue(JOB_TEXT, {"text": "hola"}, dedup_key="update:1")
+    job = store.claim("w1")
+    assert job is not None
+    response = BotResponse(message="Flashcard added:", note_id=5, actions=CARD_ACTIONS)
+
+    assert store.complete(job.id, "w1", response) is True
+    finished = store.finished()
+
+    assert [item.response for item in finished] == [response]
+    store.mark_delivered(job.id)
+    assert store.finished() == []
+
+
+def test_abandoned_lease_is_reclaimed(tmp_path: Path) -> None:
+    store = JobStore(tmp_path / "jobs.sqlite3", lease_seconds=0)
+    store.enqueue(JOB_TEXT, {"text": "hola"}, dedup_key="update:1")
+    first = store.claim("w1")
+
+    second = store.claim("w2")
+
+    assert first is not None and second is not None
+    assert second.id == first.id
+    assert second.attempts == 2
+    assert store.complete(first.id, "w1", BotResponse(message="late")) is False
+    assert store.complete(second.id, "w2", BotResponse(message="ok")) is True
+
+
+def test_failed_job_is_retried_until_max_attempts(tmp_path: Path) -> None:
+    store = JobStore(tmp_path / "jobs.sqlite3", max_attempts=2)
+    store.enqueue(JOB_TEXT, {"text": "hola"}, dedup_key="update:1")
+
+    for _ in range(2):
+        job = store.claim("w1")
+        assert job is not None
+        store.fail(job.id, "w1", "boom")
+
+    assert store.claim("w1") is None
+    assert [item.response for item in store.finished()] == [None]
+
+
+@pytest.mark.asyncio
+async def test_retry_after_crash_does_not_duplicate_card(tmp_path: Path) -> None:
+    anki = FakeAnki()
+    crashed_store = JobStore(tmp_path / "jobs.sqlite3", lease_seconds=0)
+    payload = {"text": "hola", "user_id": 1, "chat_id": 1, "message_id": 7}
+    crashed_store.enqueue(JOB_TEXT, payload, dedup_key="update:1")
+    crashed = crashed_store.claim("w1")
+    assert crashed is not None
+    await make_service(tmp_path, anki).handle_text("hola", user_id=1, message_id=7)
+
+    config = Config(telegram_token="token", allowed_user_id=1, anki_mcp_url="http://anki")
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    worker = Worker(config, make_service(tmp_path, anki), store, "w2")
+    assert await worker.run_once() is True
+
+    assert len(anki.added) == 1
+    [finished] = store.finished()
+    assert finished.response is not None
+    assert "Flashcard added" in finished.response.message
+    assert finished.response.note_id == 101
+
+
+class CrashingJobStore(JobStore):
+    def complete(self, job_id: int, worker_id: str, response: BotResponse) -> bool:
+        raise WorkerCrash
+
+
+def _worker(tmp_path: Path, anki: FakeAnki, store: JobStore, worker_id: str) -> Worker:
+    config = Config(telegram_token="token", allowed_user_id=1, anki_mcp_url="http://anki")
+    return Worker(config, make_service(tmp_path, anki), store, worker_id)
+
+
+async def _crash_then_retry(tmp_path: Path, anki: FakeAnki, kind: str, payload: dict):
+    crashed_store = CrashingJobStore(tmp_path / "jobs.sqlite3", lease_seconds=0)
+    crashed_store.enqueue(kind, payload, dedup_key="update:9")
+    with pytest.raises(WorkerCrash):
+        await _worker(tmp_path, anki, crashed_store, "w1").run_once()
+
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    assert await _worker(tmp_path, anki, store, "w2").run_once() is True
+    [finished] = store.finished()
+    assert finished.response is not None
+    return finished.response
+
+
+def _history(tmp_path: Path) -> list[int]:
+    return [note.note_id for note in StateStore(path=tmp_path / "state.sqlite3").recent_notes(5)]
+
+
+@pytest.mark.asyncio
+async def test_retried_delete_job_does_not_delete_another_card(tmp_path: Path) -> None:
+    anki = FakeAnki()
+    service = make_service(tmp_path, anki)
+    await service.handle_text("uno", user_id=1, message_id=1)
+    await service.handle_text("dos", user_id=1, message_id=2)
+
+    response = await _crash_then_retry(
+        tmp_path, anki, JOB_TEXT, {"text": "/d", "user_id": 1, "chat_id": 1, "message_id": 3}
+    )
+
+    assert "Flashcard deleted" in response.message
+    assert anki.deleted == [102]
+    assert _history(tmp_path) == [101]
+
+
+@pytest.mark.asyncio
+async def test_interrupted_delete_job_retries_its_planned_targets(tmp_path: Path) -> None:
+    anki = FakeAnki()
+    service = make_service(tmp_path, anki)
+    await service.handle_text("uno", user_id=1, message_id=1)
+    store = JobStore(tmp_path / "jobs.sqlite3", lease_seconds=0)
+    store.enqueue(
+        JOB_TEXT, {"text": "/d", "user_id": 1, "chat_id": 1, "message_id": 2}, dedup_key="u"
+    )
+    anki.crash_after_write = True
+    with pytest.raises(WorkerCrash):
+        await _worker(tmp_path, anki, store, "w1").run_once()
+    await service.handle_text("dos", user_id=1, message_id=3)
+
+    assert await _worker(tmp_path, anki, store, "w2").run_once() is True
+
+    assert anki.deleted == [101, 101]
+    assert _history(tmp_path) == [102]
+
+
+@pytest.mark.asyncio
+async def test_retried_action_job_is_not_applied_twice(tmp_path: Path) -> None:
+    anki = FakeAnki()
+    await make_service(tmp_path, anki).handle_text("hola", user_id=1, message_id=1)
+    payload = {"action": "swap", "note_id": 101, "user_id": 1, "chat_id": 1, "message_id": 2}
+
+    response = await _crash_then_retry(tmp_path, anki, JOB_ACTION, payload)
+
+    swapped = Flashcard(front="Privet", back="Hola amigo", create_reverse=False)
+    assert "Front: Privet" in response.message
+    assert anki.updated == [(101, swapped)]
+    record = StateStore(path=tmp_path / "state.sqlite3").get_note(101)
+    assert record is not None and record.result.flashcard == swapped
+
+
+class GatedGenerator(Generator):
+    def __init__(self) -> None:
+        self.release = asyncio.Event()
+
+    async def generate(self, text: str, deadline: Deadline | None = None):
+        await self.release.wait()
+        flashcard = Flashcard(front=text, back="b", create_reverse=False)
+        return GeneratorResult(flashcard=flashcard, raw_output=text)
+
+
+def test_jobs_with_same_order_key_are_claimed_in_turn(tmp_path: Path) -> None:
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.enqueue(JOB_TEXT, {}, dedup_key="update:1", order_key="user:1")
+    store.enqueue(JOB_EDIT, {}, dedup_key="update:2", order_key="user:1")
+    store.enqueue(JOB_ACTION, {}, dedup_key="update:3", order_key="note:5")
+
+    first = store.claim("w1")
+    other = store.claim("w2")
+
+    assert first is not None and first.kind == JOB_TEXT
+    assert other is not None and other.kind == JOB_ACTION
+    assert store.claim("w3") is None
+    store.complete(first.id, "w1", BotResponse(message="ok"))
+    follow_up = store.claim("w3")
+    assert follow_up is not None and follow_up.kind == JOB_EDIT
+
+
+@pytest.mark.asyncio
+async def test_edit_waits_for_overlapping_add_of_same_message(tmp_path: Path) -> None:
+    config = Config(telegram_token="token", allowed_user_id=1, anki_mcp_url="http://anki")
+    anki = FakeAnki()
+    generator = GatedGenerator()
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    message = {"user_id": 1, "chat_id": 1, "message_id": 7}
+    store.enqueue(JOB_TEXT, {**message, "text": "hola amgo"}, dedup_key="u1", order_key="user:1")
+    store.enqueue(JOB_EDIT, {**message, "text": "hola amigo"}, dedup_key="u2", order_key="user:1")
+    workers = [
+        Worker(
+            config,
+            FlashcardService(config, generator, anki, StateStore(path=tmp_path / "state.sqlite3")),
+            store,
+            worker_id,
+        )
+        for worker_id in ("w1", "w2")
+    ]
+
+    adding = asyncio.create_task(workers[0].run_once())
+    await asyncio.sleep(0.05)
+    assert await workers[1].run_once() is False
+    generator.release.set()
+    await adding
+    assert await workers[1].run_once() is True
+
+    assert [flashcard.front for flashcard in anki.added] == ["hola amgo"]
+    assert [flashcard.front for _, flashcard in anki.updated] == ["hola amigo"]
+
+
+class DeadlineRecordingGenerator(FakeGenerator):
+    def __init__(self) -> None:
+        self.deadlines: list[Deadline | None] = []
+
+    async def generate(self, text: str, deadline: Deadline | None = None):
+        self.deadlines.append(deadline)
+        return await super().generate(text, deadline)
+
+
+@pytest.mark.asyncio
+async def test_worker_uses_deadline_from_update(tmp_path: Path) -> None:
+    config = Config(telegram_token="token", allowed_user_id=1, anki_mcp_url="http://anki")
+    generator = DeadlineRecordingGenerator()
+    service = FlashcardService(config, generator, FakeAnki(), StateStore())
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    payload = {"text": "hola", "user_id": 1, "chat_id": 1, "message_id": 7}
+    store.enqueue(JOB_TEXT, {**payload, "expires_at": time.time() + 2}, dedup_key="update:1")
+
+    assert await Worker(config, service, store, "w1").run_once() is True
+
+    [deadline] = generator.deadlines
+    assert deadline is not None and deadline.remaining() <= 2.0
@@ -4,8 +4,8 @@ import os
 
 import pytest
 
-from app.anki_client import AnkiMcpClient
-from app.models import Flashcard
+from app.anki_client import AnkiMcpClient, AnkiSchemaError
+from app.models import BASIC_NOTE_TYPE, REVERSED_NOTE_TYPE, Flashcard, NoteType
 
 
 @pytest.mark.asyncio
@@ -17,3 +17,50 @@ async def test_real_anki_add_delete_sync() -> None:
     note_id = await client.add_note(Flashcard(front="Test", back="Test", create_reverse=False))
     await client.delete_note(note_id)
     await client.sync()
+
+
+@pytest.mark.asyncio
+async def test_real_anki_update_fields_and_switch_model() -> None:
+    if os.getenv("RUN_ANKI_TEST") != "1":
+        pytest.skip("Set RUN_ANKI_TEST=1 to run this test")
+
+    client = AnkiMcpClient("http://127.0.0.1:3141/", deck_name="Test")
+    note_id = await client.add_note(Flashcard(front="Test", back="Test", create_reverse=False))
+    try:
+        await client.update_note(
+            note_id, Flashcard(front="Edited", back="Test", create_reverse=False)
+        )
+        await client.update_note(
+            note_id,
+            Flashcard(front="Edited", back="Test", create_reverse=True),
+            change_model=True,
+        )
+        await client.update_note(
+            note_id,
+            Flashcard(front="Edited", back="Test", create_reverse=False),
+            change_model=True,
+        )
+    finally:
+        await client.delete_note(note_id)
+
+
+@pytest.mark.asyncio
+async def test_real_anki_schema_validation() -> None:
+    if os.getenv("RUN_ANKI_TEST") != "1":
+        pytest.skip("Set RUN_ANKI_TEST=1 to run this test")
+
+    client = AnkiMcpClient("http://127.0.0.1:3141/", deck_name="Test")
+    schema = await client.get_schema()
+
+    assert "Test" in schema.decks
+    assert {BASIC_NOTE_TYPE.model_name, REVERSED_NOTE_TYPE.model_name} <= schema.models
+    assert set(BASIC_NOTE_TYPE.field_names) <= set(schema.model_fields[BASIC_NOTE_TYPE.model_name])
+    await client.validate_schema()
+
+    broken = AnkiMcpClient(
+        "http://127.0.0.1:3141/",
+        deck_name="Test",
+        note_type=NoteType(model_name="Basic", fields=(("No such field", "{front}"),)),
+    )
+    with pytest.raises(AnkiSchemaError, match="No such field"):
+        await broken.validate_schema()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from app.evaluate import DEFAULT_GOLDEN_PATH, classify_case, evaluate, load_golden, percentile
+from app.generator import CompletionGenerator, GeneratorError, prompt_hash
+from app.models import Flashcard
+from app.recording import Recording, RecordingGenerator, ReplayGenerator, load_recordings
+
+
+class CannedGenerator(CompletionGenerator):
+    def __init__(self, outputs: dict[str, str]) -> None:
+        self._outputs = outputs
+        self.model = "test-model"
+        self.prompt_hash = prompt_hash()
+
+    async def complete(self, text, deadline=None) -> str:
+        return self._outputs[text.strip()]
+
+
+def _card(front: str, back: str = "b", reverse: bool = False) -> str:
+    return json.dumps({"front": front, "back": back, "create_reverse": reverse})
+
+
+@pytest.mark.asyncio
+async def test_recording_then_replay_returns_same_result(tmp_path: Path) -> None:
+    path = tmp_path / "recordings.jsonl"
+    recorder = RecordingGenerator(CannedGenerator({"warehouse": _card("I work here.")}), path)
+
+    recorded = await recorder.generate("  warehouse ")
+    replayed = await ReplayGenerator.from_file(path).generate("warehouse")
+
+    [recording] = load_recordings(path)
+    assert recording.input == "warehouse"
+    assert recording.model == "test-model"
+    assert recording.prompt_hash == prompt_hash()
+    assert recording.latency >= 0
+    assert replayed == recorded
+
+
+@pytest.mark.asyncio
+async def test_replay_filters_by_model_and_prompt_hash() -> None:
+    recordings = [
+        Recording("x", "old", "test-model", _card("old"), 0.1),
+        Recording("x", "new", "other-model", _card("other"), 0.1),
+        Recording("x", "new", "test-model", _card("new"), 0.1),
+    ]
+    generator = ReplayGenerator(recordings, model="test-model", prompt_hash="new")
+
+    assert (await generator.generate("x")).flashcard.front == "new"
+    assert (await generator.generate("x")).flashcard.front == "new"
+    with pytest.raises(GeneratorError, match="No recording"):
+        await generator.generate("y")
+
+
+def test_prompt_hash_changes_with_prompt_and_candidates() -> None:
+    assert prompt_hash() == prompt_hash()
+    assert prompt_hash("other prompt") != prompt_hash()
+    assert prompt_hash(candidates=3) != prompt_hash()
+
+
+@pytest.mark.parametrize(
+    ("text", "front", "expected"),
+    [
+        ("negotiate - вести переговоры", "Negotiate", "A"),
+        ("I like it here rev", "I like it here.", "B"),
+        ("warehouse", "I work in the warehouse.", "C"),
+        ("Zuchwalstwo rev", "Nie toleruję zuchwalstwa.", "C"),
+        ("кошка", "У меня есть кошку.", "C"),
+        ("cat", "I like cats.", "C"),
+        ("dog", "I like cats.", None),
+        ("ВВП r", "ВВП", "D"),
+        ("warehouse", "Something else", None),
+    ],
+)
+def test_classify_case(text: str, front: str, expected: str | None) -> None:
+    assert classify_case(text, Flashcard(front=front, back="b", create_reverse=False)) == expected
+
+
+def test_percentile_nearest_rank() -> None:
+    values = [0.4, 0.1, 0.3, 0.2]
+
+    assert percentile(values, 50) == 0.2
+    assert percentile(values, 99) == 0.4
+    assert percentile([], 50) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_evaluate_reports_quality_and_latency(tmp_path: Path) -> None:
+    golden = tmp_path / "golden.jsonl"
+    golden.write_text(
+        '{"input": "warehouse", "case": "C", "create_reverse": false}\n'
+        '{"input": "ВВП r", "case": "D", "create_reverse": true}\n'
+        '{"input": "broken", "case": "D"}\n'
+    )
+    recordings = [
+        Recording("warehouse", "h", "m", _card("I work in the warehouse."), 0.2),
+        Recording("ВВП r", "h", "m", _card("ВВП", reverse=False), 0.1),
+        Recording("broken", "h", "m", "not json", 0.3),
+    ]
+
+    report = await evaluate(ReplayGenerator(recordings), load_golden(golden), concurrency=2)
+
+    assert report.total == 3
+    assert report.generated == 3
+    assert report.parsed == 2
+    assert report.parse_success_rate == pytest.approx(2 / 3)
+    assert report.case_agreement == 1.0
+    assert report.reverse_agreement == 0.5
+    assert report.mean_prompt_tokens > report.mean_output_tokens > 0
+    assert len(report.mismatches) == 1
+
+
+def test_shipped_golden_set_loads() -> None:
+    cases = load_golden(Path(__file__).parents[1] / DEFAULT_GOLDEN_PATH)
+
+    assert {case.case for case in cases} == {"A", "B", "C", "D"}
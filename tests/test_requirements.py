@@ -3,24 +3,25 @@ from __future__ import annotations
 import pytest
 
 from app.config import Config
+from app.deadline import Deadline
 from app.generator import Generator
 from app.service import FlashcardService
 from app.state import StateStore
 
 
 class DummyGenerator(Generator):
-    async def generate(self, text: str):
+    async def generate(self, text: str, deadline: Deadline | None = None):
         raise AssertionError("Should not be called")
 
 
 class DummyAnki:
-    async def add_note(self, flashcard):
+    async def add_note(self, flashcard, *, deadline: Deadline | None = None):
         raise AssertionError("Should not be called")
 
-    async def delete_note(self, note_id: int) -> None:
+    async def delete_notes(self, note_ids: list[int], *, deadline: Deadline | None = None) -> None:
         raise AssertionError("Should not be called")
 
-    async def sync(self) -> None:
+    async def sync(self, *, deadline: Deadline | None = None) -> None:
         return None
 
 
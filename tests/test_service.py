@@ -1,28 +1,64 @@
 from __future__ import annotations
 
+import asyncio
 import json
+from pathlib import Path
 
 import pytest
 
 from app.anki_client import AnkiClientError
 from app.config import Config
-from app.generator import Generator, GeneratorError, parse_flashcard_json
+from app.deadline import Deadline
+from app.generator import (
+    Generator,
+    GeneratorError,
+    GeneratorResult,
+    parse_flashcard_candidates,
+    parse_flashcard_json,
+)
 from app.models import Flashcard
-from app.service import FlashcardService
+from app.service import (
+    ACTION_NEXT_VARIANT,
+    ACTION_REGENERATE,
+    ACTION_REVERSE,
+    ACTION_SWAP,
+    ACTION_UNDO,
+    CARD_ACTIONS,
+    DELETE_REPEATED,
+    DELETE_USAGE,
+    FlashcardService,
+)
 from app.state import StateStore
 
 
 class FakeGenerator(Generator):
     def __init__(self, response: str) -> None:
         self._response = response
+        self.calls = 0
 
-    async def generate(self, text: str):
+    async def generate(self, text: str, deadline: Deadline | None = None):
+        self.calls += 1
+        flashcard, *alternatives = parse_flashcard_candidates(self._response)
+        return GeneratorResult(
+            flashcard=flashcard, raw_output=self._response, alternatives=tuple(alternatives)
+        )
+
+
+class SlowGenerator(Generator):
+    def __init__(self, response: str) -> None:
+        self._response = response
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def generate(self, text: str, deadline: Deadline | None = None):
+        self.calls += 1
+        await self.release.wait()
         flashcard = parse_flashcard_json(self._response)
-        return type("Result", (), {"flashcard": flashcard})
+        return GeneratorResult(flashcard=flashcard, raw_output=self._response)
 
 
 class ErrorGenerator(Generator):
-    async def generate(self, text: str):
+    async def generate(self, text: str, deadline: Deadline | None = None):
         raise GeneratorError("boom")
 
 
@@ -30,26 +66,41 @@ class FakeAnki:
     def __init__(self, *, sync_fails: bool = False) -> None:
         self.added: list[Flashcard] = []
         self.deleted: list[int] = []
+        self.delete_calls = 0
+        self.updated: list[tuple[int, Flashcard, bool]] = []
         self.sync_calls = 0
         self.sync_fails = sync_fails
         self.next_id = 100
 
-    async def add_note(self, flashcard: Flashcard) -> int:
+    async def add_note(self, flashcard: Flashcard, *, deadline: Deadline | None = None) -> int:
         self.added.append(flashcard)
         self.next_id += 1
         return self.next_id
 
-    async def delete_note(self, note_id: int) -> None:
-        self.deleted.append(note_id)
-
-    async def sync(self) -> None:
+    async def delete_notes(self, note_ids: list[int], *, deadline: Deadline | None = None) -> None:
+        self.delete_calls += 1
+        self.deleted.extend(note_ids)
+
+    async def update_note(
+        self,
+        note_id: int,
+        flashcard: Flashcard,
+        *,
+        change_model: bool = False,
+        deadline: Deadline | None = None,
+    ) -> None:
+        self.updated.append((note_id, flashcard, change_model))
+
+    async def sync(self, *, deadline: Deadline | None = None) -> None:
         self.sync_calls += 1
         if self.sync_fails:
             raise AnkiClientError("sync failed")
 
 
-def make_config() -> Config:
-    return Config(telegram_token="token", allowed_user_id=123, anki_mcp_url="http://anki")
+def make_config(**overrides) -> Config:
+    return Config(
+        telegram_token="token", allowed_user_id=123, anki_mcp_url="http://anki", **overrides
+    )
 
 
 @pytest.mark.asyncio
@@ -132,3 +183,326 @@ async def test_generator_invalid_json_logs(caplog: pytest.LogCaptureFixture) ->
 
     assert "could not generate" in result.message
     assert any("Generator error" in record.message for record in caplog.records)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_messages_share_one_add() -> None:
+    generator = SlowGenerator('{"front":"A","back":"B","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+
+    first = asyncio.create_task(service.handle_text("hola", user_id=123))
+    second = asyncio.create_task(service.handle_text("  Hola ", user_id=123))
+    await asyncio.sleep(0)
+    generator.release.set()
+    results = await asyncio.gather(first, second)
+
+    assert generator.calls == 1
+    assert len(anki.added) == 1
+    assert results[0] == results[1]
+
+
+@pytest.mark.asyncio
+async def test_resend_within_window_is_absorbed() -> None:
+    response = json.dumps({"front": "Hola amigo", "back": "Privet", "create_reverse": False})
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), FakeGenerator(response), anki, StateStore())
+
+    first = await service.handle_text("hola", user_id=123)
+    second = await service.handle_text("hola", user_id=123)
+
+    assert second == first
+    assert len(anki.added) == 1
+
+
+@pytest.mark.asyncio
+async def test_resend_without_window_adds_again() -> None:
+    response = json.dumps({"front": "Hola amigo", "back": "Privet", "create_reverse": False})
+    anki = FakeAnki()
+    service = FlashcardService(
+        make_config(dedup_window_seconds=0), FakeGenerator(response), anki, StateStore()
+    )
+
+    await service.handle_text("hola", user_id=123)
+    await service.handle_text("hola", user_id=123)
+
+    assert len(anki.added) == 2
+
+
+@pytest.mark.asyncio
+async def test_edit_updates_note_in_place() -> None:
+    generator = FakeGenerator('{"front":"Hola amigo","back":"Privet","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+    await service.handle_text("hola amgo", user_id=123, message_id=7)
+
+    generator._response = '{"front":"Hola amigo","back":"Privet, drug","create_reverse":false}'
+    result = await service.handle_edit("hola amigo", user_id=123, message_id=7)
+
+    assert "Flashcard updated" in result.message
+    assert "Back: Privet, drug" in result.message
+    assert len(anki.added) == 1
+    assert anki.updated == [
+        (101, Flashcard(front="Hola amigo", back="Privet, drug", create_reverse=False), False)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_edit_of_reverse_directive_skips_generation() -> None:
+    generator = FakeGenerator('{"front":"Hola amigo","back":"Privet","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+    await service.handle_text("hola", user_id=123, message_id=7)
+
+    result = await service.handle_edit("hola rev", user_id=123, message_id=7)
+
+    assert generator.calls == 1
+    assert "Reverse card: yes" in result.message
+    assert anki.updated == [
+        (101, Flashcard(front="Hola amigo", back="Privet", create_reverse=True), True)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_edit_of_unknown_message_adds_card() -> None:
+    generator = FakeGenerator('{"front":"Hola amigo","back":"Privet","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+
+    result = await service.handle_edit("hola", user_id=123, message_id=7)
+
+    assert "Flashcard added" in result.message
+    assert len(anki.added) == 1
+    assert not anki.updated
+
+
+@pytest.mark.asyncio
+async def test_card_actions_use_cached_result() -> None:
+    generator = FakeGenerator('{"front":"Hola amigo","back":"Privet","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+    added = await service.handle_text("hola", user_id=123)
+
+    swapped = await service.handle_action(ACTION_SWAP, added.note_id, user_id=123)
+    reversed_ = await service.handle_action(ACTION_REVERSE, added.note_id, user_id=123)
+
+    assert generator.calls == 1
+    assert "Front: Privet" in swapped.message
+    assert "Reverse card: yes" in reversed_.message
+    assert anki.updated == [
+        (101, Flashcard(front="Privet", back="Hola amigo", create_reverse=False), False),
+        (101, Flashcard(front="Privet", back="Hola amigo", create_reverse=True), True),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_regenerate_action_reuses_source_text() -> None:
+    generator = FakeGenerator('{"front":"Hola amigo","back":"Privet","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+    added = await service.handle_text("hola", user_id=123)
+
+    generator._response = '{"front":"Hola chico","back":"Privet","create_reverse":false}'
+    result = await service.handle_action(ACTION_REGENERATE, added.note_id, user_id=123)
+
+    assert generator.calls == 2
+    assert "Front: Hola chico" in result.message
+    assert len(anki.added) == 1
+
+
+@pytest.mark.asyncio
+async def test_undo_action_deletes_note() -> None:
+    generator = FakeGenerator('{"front":"Hola amigo","back":"Privet","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+    added = await service.handle_text("hola", user_id=123)
+
+    result = await service.handle_action(ACTION_UNDO, added.note_id, user_id=123)
+    again = await service.handle_action(ACTION_UNDO, added.note_id, user_id=123)
+
+    assert "Flashcard deleted" in result.message
+    assert anki.deleted == [101]
+    assert again.message == "This flashcard is no longer available."
+    assert (await service.handle_text("/d", user_id=123)).message == "Nothing to delete."
+
+
+@pytest.mark.asyncio
+async def test_next_variant_cycles_cached_alternatives() -> None:
+    response = json.dumps(
+        [
+            {"front": "I work in the warehouse.", "back": "Sklad 1", "create_reverse": False},
+            {"front": "The warehouse is big.", "back": "Sklad 2", "create_reverse": False},
+        ]
+    )
+    generator = FakeGenerator(response)
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+    added = await service.handle_text("warehouse", user_id=123)
+    assert added.actions == (*CARD_ACTIONS, ACTION_NEXT_VARIANT)
+
+    second = await service.handle_action(ACTION_NEXT_VARIANT, added.note_id, user_id=123)
+    first = await service.handle_action(ACTION_NEXT_VARIANT, added.note_id, user_id=123)
+
+    assert generator.calls == 1
+    assert "Front: The warehouse is big." in second.message
+    assert "Front: I work in the warehouse." in first.message
+    assert [update[1].back for update in anki.updated] == ["Sklad 2", "Sklad 1"]
+
+
+@pytest.mark.asyncio
+async def test_low_budget_skips_sync() -> None:
+    response = json.dumps({"front": "Hola amigo", "back": "Privet", "create_reverse": False})
+    anki = FakeAnki()
+    service = FlashcardService(
+        make_config(min_sync_budget_seconds=5.0), FakeGenerator(response), anki, StateStore()
+    )
+
+    result = await service.handle_text("hola", user_id=123, deadline=Deadline.after(1.0))
+
+    assert "Flashcard added" in result.message
+    assert "sync skipped" in result.message
+    assert len(anki.added) == 1
+    assert anki.sync_calls == 0
+
+
+@pytest.mark.asyncio
+async def test_delete_many_uses_single_call_and_sync() -> None:
+    generator = FakeGenerator('{"front":"A","back":"B","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(dedup_window_seconds=0), generator, anki, StateStore())
+    for word in ("uno", "dos", "tres"):
+        await service.handle_text(word, user_id=123)
+    syncs_before = anki.sync_calls
+
+    result = await service.handle_text("/d 2", user_id=123)
+
+    assert result.message.startswith("Flashcards deleted: 2")
+    assert anki.deleted == [103, 102]
+    assert anki.delete_calls == 1
+    assert anki.sync_calls == syncs_before + 1
+    assert "Flashcard deleted" in (await service.handle_text("/d", user_id=123)).message
+    assert anki.deleted[-1] == 101
+
+
+@pytest.mark.asyncio
+async def test_delete_since_duration() -> None:
+    generator = FakeGenerator('{"front":"A","back":"B","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(dedup_window_seconds=0), generator, anki, StateStore())
+    await service.handle_text("uno", user_id=123)
+    await service.handle_text("dos", user_id=123)
+
+    result = await service.handle_text("/d since 10m", user_id=123)
+
+    assert result.message.startswith("Flashcards deleted: 2")
+    assert sorted(anki.deleted) == [101, 102]
+    assert (await service.handle_text("/d", user_id=123)).message == "Nothing to delete."
+
+
+@pytest.mark.asyncio
+async def test_delete_with_bad_arguments_shows_usage() -> None:
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), FakeGenerator("{}"), anki, StateStore())
+
+    result = await service.handle_text("/d yesterday", user_id=123)
+
+    assert result.message == DELETE_USAGE
+    assert not anki.deleted
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("command", ["/D", "/d3", "/D 2x"])
+async def test_delete_command_variants_never_add_cards(command: str) -> None:
+    generator = FakeGenerator('{"front":"A","back":"B","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+
+    result = await service.handle_text(command, user_id=123)
+
+    assert result.message in ("Nothing to delete.", DELETE_USAGE)
+    assert generator.calls == 0
+    assert not anki.added
+
+
+@pytest.mark.asyncio
+async def test_double_tapped_delete_removes_one_card() -> None:
+    generator = FakeGenerator('{"front":"A","back":"B","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+    await service.handle_text("uno", user_id=123)
+    await service.handle_text("dos", user_id=123)
+
+    first = await service.handle_text("/d", user_id=123)
+    second = await service.handle_text("/d", user_id=123)
+
+    assert "Flashcard deleted" in first.message
+    assert second.message == DELETE_REPEATED.format(command="/d")
+    assert anki.deleted == [102]
+
+    third = await service.handle_text("/d", user_id=123)
+
+    assert "Flashcard deleted" in third.message
+    assert anki.deleted == [102, 101]
+
+
+@pytest.mark.asyncio
+async def test_identical_messages_in_two_workers_share_one_add(tmp_path: Path) -> None:
+    slow = SlowGenerator('{"front":"A","back":"B","create_reverse":false}')
+    other = FakeGenerator('{"front":"A","back":"B","create_reverse":false}')
+    anki = FakeAnki()
+    state_path = tmp_path / "state.sqlite3"
+    first_worker = FlashcardService(make_config(), slow, anki, StateStore(path=state_path))
+    second_worker = FlashcardService(make_config(), other, anki, StateStore(path=state_path))
+
+    first = asyncio.create_task(first_worker.handle_text("hola", user_id=123, message_id=1))
+    await asyncio.sleep(0.05)
+    second = asyncio.create_task(second_worker.handle_text("Hola", user_id=123, message_id=2))
+    await asyncio.sleep(0.05)
+    slow.release.set()
+    results = await asyncio.gather(first, second)
+
+    assert slow.calls == 1
+    assert other.calls == 0
+    assert len(anki.added) == 1
+    assert results[0] == results[1]
+    linked = StateStore(path=state_path).note_for_message(123, 2)
+    assert linked is not None and linked.result.note_id == 101
+
+
+@pytest.mark.asyncio
+async def test_delete_after_new_card_is_not_absorbed() -> None:
+    generator = FakeGenerator('{"front":"A","back":"B","create_reverse":false}')
+    anki = FakeAnki()
+    service = FlashcardService(make_config(), generator, anki, StateStore())
+    await service.handle_text("uno", user_id=123)
+    await service.handle_text("/d", user_id=123)
+    await service.handle_text("dos", user_id=123)
+
+    await service.handle_text("/d", user_id=123)
+
+    assert anki.deleted == [101, 102]
+
+
+class SlowUpdateAnki(FakeAnki):
+    async def update_note(self, note_id, flashcard, *, change_model=False, deadline=None):
+        await asyncio.sleep(0.01)
+        await super().update_note(note_id, flashcard, change_model=change_model)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_actions_on_one_note_run_in_order() -> None:
+    anki = SlowUpdateAnki()
+    state = StateStore()
+    generator = FakeGenerator('{"front":"A","back":"B","create_reverse":false}')
+    service = FlashcardService(make_config(), generator, anki, state)
+    added = await service.handle_text("hola", user_id=123)
+    assert added.note_id is not None
+
+    await asyncio.gather(
+        service.handle_action(ACTION_SWAP, added.note_id, user_id=123),
+        service.handle_action(ACTION_SWAP, added.note_id, user_id=123),
+    )
+
+    assert [flashcard.front for _, flashcard, _ in anki.updated] == ["B", "A"]
+    record = state.get_note(added.note_id)
+    assert record is not None and record.result.flashcard.front == "A"
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from app.models import AddResult, Flashcard
+from app.state import StateStore
+
+
+def test_message_index_survives_restart(tmp_path: Path) -> None:
+    path = tmp_path / "state.sqlite3"
+    result = AddResult(note_id=42, flashcard=Flashcard(front="F", back="B", create_reverse=False))
+    store = StateStore(path=path)
+    store.record_note("hola", result)
+    store.link_message(1, 7, 42)
+
+    record = StateStore(path=path).note_for_message(1, 7)
+
+    assert record is not None
+    assert record.text == "hola"
+    assert record.result == result
+
+
+def test_forget_note_drops_message_links() -> None:
+    store = StateStore()
+    result = AddResult(note_id=42, flashcard=Flashcard(front="F", back="B", create_reverse=False))
+    store.record_note("hola", result)
+    store.link_message(1, 7, 42)
+
+    store.forget_notes([42])
+
+    assert store.note_for_message(1, 7) is None
+
+
+def test_history_is_bounded_and_persisted(tmp_path: Path) -> None:
+    path = tmp_path / "state.sqlite3"
+    store = StateStore(path=path, history_limit=2)
+    for note_id in (1, 2, 3):
+        flashcard = Flashcard(front=str(note_id), back="B", create_reverse=False)
+        store.record_note(str(note_id), AddResult(note_id=note_id, flashcard=flashcard))
+
+    reloaded = StateStore(path=path, history_limit=2)
+
+    assert [result.note_id for result in reloaded.recent_notes(10)] == [3, 2]
+    assert reloaded.last_added is not None
+    assert reloaded.last_added.note_id == 3
+    assert reloaded.get_note(1) is None
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+from telegram.ext import CallbackQueryHandler, MessageHandler
+
+from app.config import Config
+from app.jobs import JOB_ACTION, JOB_TEXT, JobStore
+from app.models import BotResponse
+from app.service import CARD_ACTIONS
+from app.telegram_adapter import (
+    JOB_FAILED_MESSAGE,
+    build_application,
+    build_frontend_application,
+    build_keyboard,
+    deliver_finished_jobs,
+    parse_callback_data,
+)
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.sent: list[tuple[int, str, int]] = []
+        self.edited: list[tuple[int, str, int]] = []
+
+    async def send_message(self, chat_id, text, *, reply_to_message_id, reply_markup):
+        self.sent.append((chat_id, text, reply_to_message_id))
+
+    async def edit_message_text(self, text, *, chat_id, message_id, reply_markup):
+        self.edited.append((chat_id, text, message_id))
+
+
+def test_keyboard_round_trips_callback_data() -> None:
+    keyboard = build_keyboard(BotResponse(message="ok", note_id=42, actions=CARD_ACTIONS))
+
+    assert keyboard is not None
+    data = [button.callback_data for row in keyboard.inline_keyboard for button in row]
+    assert [parse_callback_data(item) for item in data] == [(action, 42) for action in CARD_ACTIONS]
+
+
+def test_no_keyboard_without_note() -> None:
+    assert build_keyboard(BotResponse(message="Nothing to delete.")) is None
+    assert parse_callback_data("undo:abc") is None
+
+
+@pytest.mark.asyncio
+async def test_deliver_finished_jobs(tmp_path: Path) -> None:
+    store = JobStore(tmp_path / "jobs.sqlite3", max_attempts=1)
+    store.enqueue(JOB_TEXT, {"chat_id": 1, "message_id": 7}, dedup_key="update:1")
+    store.enqueue(JOB_ACTION, {"chat_id": 1, "message_id": 8}, dedup_key="update:2")
+    text_job = store.claim("w1")
+    action_job = store.claim("w1")
+    assert text_job is not None and action_job is not None
+    store.fail(text_job.id, "w1", "boom")
+    store.complete(action_job.id, "w1", BotResponse(message="Flashcard updated:"))
+    bot = FakeBot()
+
+    assert await deliver_finished_jobs(bot, store) == 2
+
+    assert bot.sent == [(1, JOB_FAILED_MESSAGE, 7)]
+    assert bot.edited == [(1, "Flashcard updated:", 8)]
+    assert await deliver_finished_jobs(bot, store) == 0
+
+
+class FakeQuery:
+    def __init__(self, data: str, events: list[str]) -> None:
+        self.data = data
+        self._events = events
+
+    async def answer(self) -> None:
+        self._events.append("answer")
+
+    async def edit_message_text(self, text, *, reply_markup) -> None:
+        self._events.append("edit")
+
+
+class RecordingService:
+    def __init__(self, events: list[str]) -> None:
+        self._events = events
+
+    async def handle_action(self, action, note_id, user_id, deadline=None) -> BotResponse:
+        self._events.append(f"{action}:{note_id}")
+        return BotResponse(message="Flashcard updated:", note_id=note_id, actions=CARD_ACTIONS)
+
+
+@pytest.mark.asyncio
+async def test_callback_is_answered_before_action_runs() -> None:
+    events: list[str] = []
+    config = Config(telegram_token="1:token", allowed_user_id=1, anki_mcp_url="")
+    application = build_application(config, RecordingService(events))
+    [handler] = [h for h in application.handlers[0] if isinstance(h, CallbackQueryHandler)]
+    update = SimpleNamespace(
+        callback_query=FakeQuery("regen:5", events), effective_user=SimpleNamespace(id=1)
+    )
+
+    await handler.callback(update, None)
+
+    assert events == ["answer", "regen:5", "edit"]
+    assert handler.block is False
+
+
+def test_bot_mode_handles_messages_in_order() -> None:
+    config = Config(telegram_token="1:token", allowed_user_id=1, anki_mcp_url="")
+    application = build_application(config, RecordingService([]))
+    message_handlers = [h for h in application.handlers[0] if isinstance(h, MessageHandler)]
+
+    assert application.concurrent_updates == 1
+    assert message_handlers and all(handler.block for handler in message_handlers)
+
+
+class StaleQuery(FakeQuery):
+    def __init__(self, data: str, chat_id: int, message_id: int) -> None:
+        super().__init__(data, [])
+        self.message = SimpleNamespace(chat_id=chat_id, message_id=message_id)
+
+    async def answer(self) -> None:
+        raise BadRequest("Query is too old and response timeout expired")
+
+
+@pytest.mark.asyncio
+async def test_frontend_queues_button_press_when_answer_fails(tmp_path: Path) -> None:
+    config = Config(telegram_token="1:token", allowed_user_id=1, anki_mcp_url="")
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    application = build_frontend_application(config, store)
+    [handler] = [h for h in application.handlers[0] if isinstance(h, CallbackQueryHandler)]
+    update = SimpleNamespace(
+        update_id=3, callback_query=StaleQuery("swap:5", 1, 8), effective_user=SimpleNamespace(id=1)
+    )
+
+    await handler.callback(update, None)
+
+    job = store.claim("w1")
+    assert job is not None
+    assert job.payload["action"] == "swap"
+    assert job.payload["note_id"] == 5
+    assert job.payload["expires_at"] > time.time()